@@ -4,11 +4,33 @@ from Modules.AiContact.AiContactor import AiContactor
 from Modules.VoiceOutput.VoiceOutputer import VoiceOutputer
 from Modules.RobotServer.RobotTCPServer import RobotTCPServer
 from Modules.Timer.Timer import SetTimer
+from Core.StatusTracker import StatusTracker
+from Core.TaskLane import TaskLane
 from Core.utility import get_logger
 import queue
 import json
 import time
 
+DEVICE_REFRESH_INTERVAL = 300  # seconds between full device rediscovery
+
+# Which lane runs each task type:
+# - control: robot teleop/status and direct device toggles, must stay responsive
+# - conversation: voice and chat turns that wait on the LLM and speech, strictly in order
+TASK_LANES = {
+    "robot_status": "control",
+    "robot_connection": "control",
+    "robot_move": "control",
+    "robot_car": "control",
+    "client_device": "control",
+    "switchbot_event": "control",
+    "user_call_name": "conversation",
+    "voice_input": "conversation",
+    "chat_message": "conversation",
+    "system_message": "conversation",
+    "timer_action": "conversation",
+    "device_result": "conversation",
+}
+
 class AgentControl:
     _instance = None
     _agent_name = "把握"
@@ -55,6 +77,14 @@ class AgentControl:
         }
         AgentControl._instance.push_task(task)
 
+    @staticmethod
+    def get_robot_connection(connected):
+        task = {
+            "type": "robot_connection",
+            "connected": connected
+        }
+        AgentControl._instance.push_task(task)
+
     def push_task(self, task):
         self.task_queue.put(task)
 
@@ -68,15 +98,24 @@ class AgentControl:
         self.voice_collector.SetCallback(AgentControl.get_voice_input)
         self.task_queue = queue.Queue()
         self.device_controller = DeviceController(switch_bot_creds=configs["SwitchBot"], whisker_creds=configs['Whisker'], roborock_creds=configs['Roborock'])
-        self.device_controller.updateDevices()
         self.ai_contactor = AiContactor(mode="DEEPSEEK", key=configs["DeepSeek"]["Key"])
+        self.ai_contactor.on_message_added = self.publish_status
         self.voice_outputer = VoiceOutputer()
         self.set_timer = SetTimer()
         self.wait_for_user_instruction = False
-        self.last_time_update_devices = time.time()
-        self.robot_server = RobotTCPServer(host='0.0.0.0', port=9000, callback=AgentControl.get_robot_status)
+        self.robot_status = []
+        self.status_tracker = StatusTracker()
+        self.lanes = {
+            "control": TaskLane("control", self.run_task, workers=3, max_pending=200),
+            "conversation": TaskLane("conversation", self.run_task, workers=1),
+        }
+        self.robot_server = RobotTCPServer(host='0.0.0.0', port=9000, callback=AgentControl.get_robot_status, connection_callback=AgentControl.get_robot_connection)
         self.robot_server.start()
-        self.robot_status = {}
+        # Device changes publish status, so start the device side once everything publish_status uses exists
+        self.device_controller.warmStart()
+        self.device_controller.on_change = self.publish_status
+        self.device_controller.startRefresher(DEVICE_REFRESH_INTERVAL)
+        self.device_controller.startPoller()
 
     def re_generate_system_message(self):
         action_list_info = self.device_controller.getActionInfo()
@@ -92,7 +131,12 @@ class AgentControl:
                 statuses = action["action_params"]["status"]
                 if action["message"] != "" and not no_sound:
                     self.voice_outputer.speak(action["message"])
-                self.device_controller.changeDeviceStatus(aliases, statuses)
+                # Spoken feedback only when there is more to say than the confirmation above
+                self.device_controller.submitChangeDeviceStatus(aliases, statuses, on_done=lambda job: self.push_task({
+                    "type": "device_result",
+                    "message": job.summary(),
+                    "speak": not no_sound and (len(job.aliases) > 1 or job.state == "failed")
+                }))
             elif action["action"] == "MessageOnly":
                 if action["message"] != "" and not no_sound:
                     self.voice_outputer.speak(action["message"])
@@ -119,6 +163,8 @@ class AgentControl:
                 if action["message"] != "" and not no_sound:
                     self.voice_outputer.speak(action["message"])
                 self.set_timer.add_timer(action["action_params"]["timestamp"], action["action_params"]["actions"], action["action_params"]["emailNotify"])
+                # Wake the dispatcher so it waits for the new timer's deadline
+                self.push_task({"type": "timers_changed"})
             else:
                 raise ValueError(f"Unknown action: {action['action']}")
 
@@ -131,56 +177,118 @@ class AgentControl:
             return success, action
         return False, {}
 
-    def process_task(self):
-        if not self.task_queue.empty():
-            task = self.task_queue.get()
-            if task["type"] != "robot_status":
-                self.logger.info(f"Processing task: {task}")
-            if task["type"] == "user_call_name":
-                self.stop_voice_collection()
-                self.wait_for_user_instruction = True
-                self.voice_outputer.speak("我在")
-                self.start_voice_collection()
-            elif task["type"] == "voice_input" or task['type'] == "chat_message":
-                self.wait_for_user_instruction = False
-                self.stop_voice_collection()
-                self.logger.info(f"User said: {task['text']}")
-                self.re_generate_system_message()
-                success, action = self.input_local_filter(task['text'])
-                if success:
-                    self.ai_contactor.add_message_history(task['text'])
-                    self.ai_contactor.add_message_history(json.dumps(action), role="assistant")
-                    self.process_response(action, task['type'] == "chat_message")
-                else:
-                    response = self.ai_contactor.communicate(task["text"])
-                    self.process_response(response, task['type'] == "chat_message")
-                self.start_voice_collection()
-            elif task["type"] == "system_message":
-                self.wait_for_user_instruction = False
-                self.stop_voice_collection()
-                self.logger.info(f"System Message: {task['text']}")
-                self.re_generate_system_message()
-                response = self.ai_contactor.communicate(task["text"], from_type=3)
-                self.process_response(response)
-                self.start_voice_collection()
-            elif task["type"] == "robot_status":
-                #self.logger.info(f"Robot status received: {task['status']}")
-                self.robot_status = task["status"]
-            elif task['type'] == "robot_move":
-                self.robot_server.send_command("move", task['command'])
-            elif task['type'] == "robot_car":
-                self.robot_server.send_command("car", task['command'])
-            elif task['type'] == "client_device":
-                self.device_controller.changeDeviceStatus([task['target']], [task['targetStatus']])
-            elif task['type'] == "timer_action":
-                self.logger.info(f"Processing timer action: {task['action']}")
+    def process_task(self, timeout=0):
+        """Wait up to `timeout` seconds for tasks, hand every ready task to its lane, then run due maintenance"""
+        try:
+            task = self.task_queue.get(timeout=timeout)
+            while True:
+                self.dispatch_task(task)
+                task = self.task_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.run_maintenance()
+
+    def dispatch_task(self, task):
+        lane = TASK_LANES.get(task.get("type"))
+        if lane is None:
+            if task.get("type") != "timers_changed":
+                self.logger.error(f"Unknown task type: {task}")
+            return
+        self.lanes[lane].put(task, key=self.ordering_key(task), coalesce_key=self.coalesce_key(task))
+
+    @staticmethod
+    def ordering_key(task):
+        """Tasks with the same key run in order; different keys may run side by side"""
+        if task["type"].startswith("robot_"):
+            return "robot"
+        if task["type"] == "client_device":
+            return f"device:{task.get('target')}"
+        return None
+
+    @staticmethod
+    def coalesce_key(task):
+        """A waiting task with the same key is replaced by the newer one instead of both running"""
+        if task["type"] in ("robot_status", "robot_connection"):
+            # Only the latest state matters
+            return task["type"]
+        if task["type"] == "client_device":
+            # Toggles of one device that queue up while it is busy collapse into the last requested state
+            return f"device:{task.get('target')}"
+        return None
+
+    def run_task(self, task):
+        """Lane worker entry point"""
+        try:
+            self.handle_task(task)
+        finally:
+            self.publish_status()
+
+    def next_wait_timeout(self):
+        """Seconds until the next timer is due, None (wait for a task) if there are no timers"""
+        next_timer = self.set_timer.next_due()
+        if next_timer is None:
+            return None
+        return max(next_timer - time.time(), 0)
+
+    def handle_task(self, task):
+        if task["type"] != "robot_status":
+            self.logger.info(f"Processing task: {task}")
+        if task["type"] == "user_call_name":
+            self.stop_voice_collection()
+            self.wait_for_user_instruction = True
+            self.voice_outputer.speak("我在")
+            self.start_voice_collection()
+        elif task["type"] == "voice_input" or task['type'] == "chat_message":
+            self.wait_for_user_instruction = False
+            self.stop_voice_collection()
+            self.logger.info(f"User said: {task['text']}")
+            self.re_generate_system_message()
+            success, action = self.input_local_filter(task['text'])
+            if success:
+                self.ai_contactor.add_message_history(task['text'])
+                self.ai_contactor.add_message_history(json.dumps(action), role="assistant")
+                self.process_response(action, task['type'] == "chat_message")
+            else:
+                response = self.ai_contactor.communicate(task["text"])
+                self.process_response(response, task['type'] == "chat_message")
+            self.start_voice_collection()
+        elif task["type"] == "system_message":
+            self.wait_for_user_instruction = False
+            self.stop_voice_collection()
+            self.logger.info(f"System Message: {task['text']}")
+            self.re_generate_system_message()
+            response = self.ai_contactor.communicate(task["text"], from_type=3)
+            self.process_response(response)
+            self.start_voice_collection()
+        elif task["type"] == "robot_status":
+            #self.logger.info(f"Robot status received: {task['status']}")
+            self.robot_status = task["status"]
+        elif task["type"] == "robot_connection":
+            # robot_server.is_connected is already up to date, just publish it
+            pass
+        elif task['type'] == "robot_move":
+            self.robot_server.send_command("move", task['command'])
+        elif task['type'] == "robot_car":
+            self.robot_server.send_command("car", task['command'])
+        elif task['type'] == "client_device":
+            self.device_controller.submitChangeDeviceStatus([task['target']], [task['targetStatus']])
+        elif task['type'] == "switchbot_event":
+            self.device_controller.handleSwitchBotEvent(task['event'])
+        elif task['type'] == "timer_action":
+            self.logger.info(f"Processing timer action: {task['action']}")
+            self.stop_voice_collection()
+            self.process_response(task['action'])
+            self.start_voice_collection()
+        elif task['type'] == "device_result":
+            # Outcome of a ControlDevice action, kept as a system note so the chat and the LLM see it
+            self.ai_contactor.add_message_history(f"Device change result: {task['message']}", role="system")
+            if task['speak']:
                 self.stop_voice_collection()
-                self.process_response(task['action'])
+                self.voice_outputer.speak(task['message'])
                 self.start_voice_collection()
-        now = time.time()
-        if now - self.last_time_update_devices > 300:
-            self.device_controller.updateDevices()
-            self.last_time_update_devices = now
+
+    def run_maintenance(self):
+        """Fire timers when they are due"""
         due_timers = self.set_timer.execute_timers()
         for timer in due_timers:
             self.logger.info(f"Executing timer set for {timer.timestamp}")
@@ -195,6 +303,8 @@ class AgentControl:
         status = {
             "messages": self.ai_contactor.get_message_list(),
             "devices": self.device_controller.getDevicesInfo(),
+            "device_jobs": self.device_controller.getJobsInfo(),
+            "backends": self.device_controller.getBackendHealth(),
             "robot": {
                 "connected": self.robot_server.is_connected,
                 "status": self.robot_status
@@ -202,6 +312,24 @@ class AgentControl:
         }
         return status
 
+    def get_status_since(self, since=None, full=False):
+        """Versioned status: returns (version, status), status is None if unchanged since `since`"""
+        return self.status_tracker.status_since(self.get_status(), since, full)
+
+    def publish_status(self):
+        """Push whatever changed since the last publish to status subscribers"""
+        try:
+            self.status_tracker.publish(self.get_status())
+        except Exception as e:
+            self.logger.error(f"Error publishing status: {e}")
+
+    def subscribe_status(self, listener):
+        """listener(kind, payload) gets one "snapshot" and then a "delta" for every change"""
+        self.status_tracker.subscribe(listener, self.get_status())
+
+    def unsubscribe_status(self, listener):
+        self.status_tracker.unsubscribe(listener)
+
     def start_voice_collection(self):
         self.logger.info("Starting voice collection...")
         self.voice_collector.Start()
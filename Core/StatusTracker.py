@@ -0,0 +1,179 @@
+import threading
+import time
+from Core.utility import get_logger
+
+logger = get_logger(__name__)
+
+# Top-level status lists whose entries are diffed by a key field. Deltas carry
+# changed entries under the section name and removed keys under "removed_<section>".
+KEYED_SECTIONS = {"devices": "alias", "device_jobs": "id", "backends": "name"}
+
+def _by_key(items, key):
+    return {item[key]: item for item in items}
+
+def _diff_keyed(old_items, new_items, key):
+    """(changed or added entries, removed keys) between two keyed lists"""
+    old_by_key = _by_key(old_items or [], key)
+    new_by_key = _by_key(new_items or [], key)
+    changed = [item for k, item in new_by_key.items() if old_by_key.get(k) != item]
+    removed = [k for k in old_by_key if k not in new_by_key]
+    return changed, removed
+
+def _apply_keyed(items, changed, removed, key):
+    removed = set(removed)
+    if removed:
+        items[:] = [item for item in items if item[key] not in removed]
+    for entry in changed:
+        for i, item in enumerate(items):
+            if item[key] == entry[key]:
+                items[i] = entry
+                break
+        else:
+            items.append(entry)
+
+def apply_delta(snapshot, delta):
+    """Apply a delta produced by StatusTracker to a status snapshot in place"""
+    if "first_seq" in delta:
+        snapshot["messages"] = [m for m in snapshot["messages"] if m["seq"] >= delta["first_seq"]]
+    snapshot["messages"].extend(delta.get("messages", []))
+    if "version" in delta:
+        snapshot["version"] = delta["version"]
+
+    for section, key in KEYED_SECTIONS.items():
+        if section in delta or f"removed_{section}" in delta:
+            _apply_keyed(snapshot.setdefault(section, []), delta.get(section, []), delta.get(f"removed_{section}", []), key)
+
+    robot_delta = delta.get("robot")
+    if robot_delta:
+        robot = snapshot["robot"]
+        if "connected" in robot_delta:
+            robot["connected"] = robot_delta["connected"]
+        _apply_keyed(robot["status"], robot_delta.get("status", []), robot_delta.get("removed_status", []), "key")
+    return snapshot
+
+class StatusTracker:
+    """
+    Remembers the last published status and turns every change into a delta
+    for subscribers: new messages, changed devices and changed robot keys.
+    Listeners are called as listener(kind, payload) where kind is "snapshot"
+    (sent once on subscribe) or "delta". All calls happen under one lock, so
+    each listener sees its snapshot before any delta that follows it.
+
+    Every published change bumps a version number, carried in snapshots and
+    deltas as "version". Plain readers can use it as a cursor with
+    status_since().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = []
+        # Start from the clock so versions keep growing across agent restarts
+        self.version = int(time.time() * 1000)
+        self.section_versions = {section: self.version for section in ["messages", "robot", *KEYED_SECTIONS]}
+        self.message_versions = {}  # message seq -> version it was published in
+        self.status = {"messages": [], "robot": {"connected": False, "status": []}, "version": self.version}
+        for section in KEYED_SECTIONS:
+            self.status[section] = []
+
+    def subscribe(self, listener, status):
+        with self.lock:
+            self._publish(status)
+            self.listeners.append(listener)
+            self._notify(listener, "snapshot", self.status)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def publish(self, status):
+        with self.lock:
+            self._publish(status)
+
+    def status_since(self, status, since=None, full=False):
+        """
+        Publish status, then return (version, result). result is None when
+        nothing changed after version `since`. Otherwise it is the full status,
+        or with full=False and a usable `since`, only what changed: newer
+        messages (plus "first_seq", the oldest message still kept), and the
+        device list and robot status only if they changed.
+        """
+        with self.lock:
+            self._publish(status)
+            if since == self.version:
+                return self.version, None
+            if full or since is None or since > self.version:
+                return self.version, self.status
+            result = {
+                "version": self.version,
+                "messages": [m for m in self.status["messages"] if self.message_versions.get(m["seq"], self.version) > since],
+                "first_seq": self.status["messages"][0]["seq"] if self.status["messages"] else None,
+            }
+            for section in KEYED_SECTIONS:
+                if self.section_versions[section] > since:
+                    result[section] = self.status.get(section, [])
+            if self.section_versions["robot"] > since:
+                result["robot"] = self.status["robot"]
+            return self.version, result
+
+    def _publish(self, status):
+        delta = self._diff(self.status, status)
+        if not delta:
+            return
+        self.version += 1
+        delta["version"] = self.version
+        if "messages" in delta or "first_seq" in delta:
+            self.section_versions["messages"] = self.version
+        for section in KEYED_SECTIONS:
+            if section in delta or f"removed_{section}" in delta:
+                self.section_versions[section] = self.version
+        if "robot" in delta:
+            self.section_versions["robot"] = self.version
+        for message in delta.get("messages", []):
+            self.message_versions[message["seq"]] = self.version
+        if "first_seq" in delta:
+            self.message_versions = {seq: v for seq, v in self.message_versions.items() if seq >= delta["first_seq"]}
+        self.status = dict(status, version=self.version)
+        for listener in list(self.listeners):
+            self._notify(listener, "delta", delta)
+
+    def _notify(self, listener, kind, payload):
+        try:
+            listener(kind, payload)
+        except Exception as e:
+            logger.error(f"Status listener failed, unsubscribing: {e}")
+            self.listeners.remove(listener)
+
+    @staticmethod
+    def _diff(old, new):
+        delta = {}
+
+        old_messages, new_messages = old["messages"], new["messages"]
+        last_seq = old_messages[-1]["seq"] if old_messages else -1
+        added = [m for m in new_messages if m["seq"] > last_seq]
+        if added:
+            delta["messages"] = added
+        old_first = old_messages[0]["seq"] if old_messages else None
+        new_first = new_messages[0]["seq"] if new_messages else last_seq + 1
+        if old_first is not None and new_first != old_first:
+            delta["first_seq"] = new_first
+
+        for section, key in KEYED_SECTIONS.items():
+            changed, removed = _diff_keyed(old.get(section), new.get(section), key)
+            if changed:
+                delta[section] = changed
+            if removed:
+                delta[f"removed_{section}"] = removed
+
+        robot = {}
+        if old["robot"]["connected"] != new["robot"]["connected"]:
+            robot["connected"] = new["robot"]["connected"]
+        changed, removed = _diff_keyed(old["robot"]["status"], new["robot"]["status"], "key")
+        if changed:
+            robot["status"] = changed
+        if removed:
+            robot["removed_status"] = removed
+        if robot:
+            delta["robot"] = robot
+
+        return delta
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict, deque
+from Core.utility import get_logger
+
+class TaskLane:
+    """
+    A queue of tasks with its own worker threads.
+
+    Tasks with the same ordering key run one at a time in the order they
+    were put; tasks with different keys may run in parallel on different
+    workers. Keys take turns, so a busy key can't starve the others.
+
+    A task put with a coalesce key replaces the waiting task with the same
+    coalesce key (keeping its place in line) instead of queueing behind it,
+    so state updates never pile up. At most max_pending tasks wait; past
+    that new tasks are dropped.
+    """
+
+    def __init__(self, name, handler, workers=1, max_pending=1000):
+        self.logger = get_logger(__name__)
+        self.name = name
+        self.handler = handler
+        self.condition = threading.Condition()
+        self.queues = OrderedDict()  # ordering key -> deque of entries, an entry is [task, coalesce key]
+        self.running = set()  # ordering keys with a task being handled
+        self.waiting = {}  # coalesce key -> its entry still in a queue
+        self.max_pending = max_pending
+        self.pending_count = 0
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"lane-{name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, task, key=None, coalesce_key=None):
+        """Queue a task; returns False if it was dropped because the lane is full"""
+        with self.condition:
+            entry = self.waiting.get(coalesce_key) if coalesce_key is not None else None
+            if entry is not None:
+                entry[0] = task
+                return True
+            if self.pending_count >= self.max_pending:
+                self.logger.error(f"Lane {self.name} is full, dropping task {task.get('type')}")
+                return False
+            entry = [task, coalesce_key]
+            if coalesce_key is not None:
+                self.waiting[coalesce_key] = entry
+            self.queues.setdefault(key, deque()).append(entry)
+            self.pending_count += 1
+            self.condition.notify()
+            return True
+
+    def pending(self):
+        with self.condition:
+            return self.pending_count
+
+    def _next(self):
+        # Called with self.condition held; oldest waiting key that isn't running
+        for key in self.queues:
+            if key not in self.running:
+                entries = self.queues.pop(key)
+                task, coalesce_key = entries.popleft()
+                if entries:
+                    self.queues[key] = entries  # back of the line
+                if coalesce_key is not None:
+                    del self.waiting[coalesce_key]
+                self.pending_count -= 1
+                self.running.add(key)
+                return key, task
+        return None, None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                key, task = self._next()
+                while task is None:
+                    self.condition.wait()
+                    key, task = self._next()
+            try:
+                self.handler(task)
+            except Exception as e:
+                self.logger.error(f"Lane {self.name} task error: {e}")
+            finally:
+                with self.condition:
+                    self.running.discard(key)
+                    self.condition.notify_all()
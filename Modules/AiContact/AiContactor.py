@@ -19,6 +19,8 @@ class AiContactor:
         self.system_message = ""
         self.message_list = [
         ]
+        self.next_seq = 0
+        self.on_message_added = None  # optional callback, called after every new message
 
     def parse_response(self, response_text):
         self.logger.info(f"Response from AI model: {response_text}")
@@ -64,13 +66,21 @@ class AiContactor:
         return response
     
     def add_message_history(self, message, role="user"):
+        self.append_message(role, message)
+
+    def append_message(self, role, content):
+        # seq only ever grows, so status readers can ask for "messages after seq N"
         self.message_list.append({
+            "seq": self.next_seq,
             "time": time.time(),
             "message":{
                 "role": role,
-                "content": message
+                "content": content
             }
         })
+        self.next_seq += 1
+        if self.on_message_added:
+            self.on_message_added()
 
     def generate_system_message(self, action_list_info):
         self.system_message = {
@@ -114,15 +124,8 @@ class AiContactor:
             sender = "assistant"
         elif from_type == 3:
             sender = "system"
-        new_message = {
-            "time": time.time(),
-            "message":{
-                "role": sender,
-                "content": user_message
-            }
-        }
-        self.message_list.append(new_message)
         self.clean_up_messages()
+        self.append_message(sender, user_message)
         
         final_messages = [self.system_message]
         for msg in self.message_list:
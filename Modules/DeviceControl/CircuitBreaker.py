@@ -0,0 +1,92 @@
+import time
+from Core.utility import get_logger
+
+class CircuitOpen(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Failure isolation for one device backend. After `threshold` failures in
+    a row the circuit opens and calls fail at once for `cooldown` seconds.
+    Then it is half-open: one probe call goes through, success closes the
+    circuit and failure opens it again with the cooldown doubled, up to
+    `max_cooldown`. Exceptions of the `local_errors` types are raised on
+    without counting, they say nothing about the backend. Must be used from
+    one event loop.
+    """
+
+    def __init__(self, name, threshold=3, cooldown=30, max_cooldown=600, local_errors=(), on_change=None):
+        self.logger = get_logger(__name__)
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.local_errors = local_errors
+        self.on_change = on_change  # optional callback, called when the state changes
+        self.state = "closed"  # closed, open or half_open
+        self.failures = 0
+        self.cooldown = cooldown
+        self.retry_at = None  # time.time() the next probe is allowed while open
+        self.probing = False
+        self.last_error = None
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.logger.info(f"{self.name} circuit {self.state} -> {state}")
+            self.state = state
+            if self.on_change:
+                self.on_change()
+
+    def allow(self):
+        """True if a call may go out now; in half-open state only one probe at a time"""
+        if self.state == "open" and time.time() >= self.retry_at:
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.probing = False
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.retry_at = None
+        self._set_state("closed")
+
+    def record_failure(self, error):
+        self.probing = False
+        self.failures += 1
+        self.last_error = str(error)
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.threshold:
+            return
+        self.retry_at = time.time() + self.cooldown
+        self._set_state("open")
+
+    async def call(self, fn):
+        """Await `fn()` through the breaker; raises CircuitOpen without calling it while open"""
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable, retrying after {time.strftime('%H:%M:%S', time.localtime(self.retry_at))}")
+        try:
+            result = await fn()
+        except BaseException as e:
+            # Neither a cancelled call nor a local error says anything about the backend
+            if isinstance(e, Exception) and not isinstance(e, self.local_errors):
+                self.record_failure(e)
+            else:
+                self.probing = False
+            raise
+        self.record_success()
+        return result
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "retry_at": self.retry_at,
+            "last_error": self.last_error,
+        }
@@ -1,19 +1,33 @@
 import asyncio
+import itertools
+import random
+import threading
+from collections import OrderedDict
 from kasa import Discover
 from Core.utility import get_logger
-from pylitterbot import Account
+from Modules.DeviceControl.SwitchBotClient import SwitchBotClient, SwitchBotQuotaExceeded, BUDGET_PATH
+from Modules.DeviceControl.WhiskerSession import WhiskerSession
+from Modules.DeviceControl.CircuitBreaker import CircuitBreaker, CircuitOpen
 import json
+import os
 import time
-import hashlib
-import hmac
-import base64
-import uuid
-import requests
-from roborock import HomeDataProduct, DeviceData, RoborockCommand
-from roborock.version_1_apis import RoborockMqttClientV1, RoborockLocalClientV1
-from roborock.web_api import RoborockApiClient
+from roborock import RoborockCommand
+from Modules.DeviceControl.RoborockSession import RoborockSession
 
 class Device:
+    # How a change is confirmed: the first status poll comes confirm_first_delay
+    # seconds after the command, the gap doubles up to confirm_max_delay, and
+    # we give up confirm_deadline seconds after the command was sent
+    confirm_first_delay = 0.5
+    confirm_max_delay = 4
+    confirm_deadline = 15
+    # Background polling: every poll_idle seconds normally, every poll_active
+    # seconds while the device is busy or was just changed. A status read
+    # longer than state_ttl seconds ago is reported as stale.
+    poll_idle = 120
+    poll_active = 5
+    state_ttl = 300
+
     def __init__(self, actual_device):
         self.actual_device = actual_device
 
@@ -36,10 +50,63 @@ class Device:
     async def update_status(self):
         pass
 
+    def is_active(self):
+        """True while the device is doing something worth watching closely"""
+        return False
+
+    def pushes_state(self):
+        """True if the device reports its own changes, so confirmation can wait instead of polling"""
+        return False
+
+    async def wait_for_status(self, target, timeout):
+        """Wait up to `timeout` seconds for a pushed update showing `target`; True if one came"""
+        return False
+
+    def to_record(self):
+        """JSON-able state for the saved registry, None if the device can't be restored"""
+        return None
+
+    @staticmethod
+    def from_record(record):
+        """Device restored from to_record(), usable before the backend is reached"""
+        return None
+
+    def refresh_from(self, other):
+        """
+        Take over the state of a freshly discovered object for the same device.
+        If discovery didn't read the status, the cached one is kept.
+        """
+        fresh = dict(other.__dict__)
+        if other.get_status().lower() == "unknown":
+            for name in ("status", "status_"):
+                fresh.pop(name, None)
+        self.__dict__.update(fresh)
+
+    async def close(self):
+        """Release connections this object holds, before it is replaced or retired"""
+        pass
+
 class SwitchBotDevice(Device):
-    # Declare empty header dictionary
-    apiHeader = {}
-    credentials = {}
+    client = None  # SwitchBotClient shared by all SwitchBot devices
+    webhook_active = False  # set once a webhook event arrived, from then on changes are confirmed by events
+    status_events = {}  # deviceId -> asyncio.Event, set on every webhook event for the device
+    # Cloud status lags the bot by a few seconds; poll gently, every poll costs quota
+    confirm_first_delay = 3
+    confirm_max_delay = 10
+    confirm_deadline = 60
+    poll_idle = 900
+    poll_active = 30
+    state_ttl = 1800
+
+    @staticmethod
+    def configure(creds, budget_path=BUDGET_PATH):
+        SwitchBotDevice.client = SwitchBotClient(
+            token=creds['Key'], # copy and paste from the SwitchBot app V6.14 or later
+            secret=creds['Secret'], # copy and paste from the SwitchBot app V6.14 or later
+            daily_limit=creds.get('DailyLimit', 10000),
+            reserve=creds.get('CommandReserve', 1000),
+            budget_path=budget_path,
+        )
 
     def __init__(self, actual_device):
         super().__init__(actual_device)
@@ -47,20 +114,19 @@ class SwitchBotDevice(Device):
 
     @staticmethod
     async def discorverDevices():
-        SwitchBotDevice.authenticate()
         result = {}
-        url = "https://api.switch-bot.com/v1.1/devices"
-        response = requests.get(url, headers=SwitchBotDevice.apiHeader)
+        response = await SwitchBotDevice.client.get("/v1.1/devices")
         allow_device_types = ['Bot']
-        if response.status_code == 200:
-            data = response.json()
-            devices = data['body']['deviceList']
-            for dev in devices:
-                if dev['deviceType'] in allow_device_types:
-                    result[dev['deviceName']] = SwitchBotDevice(dev)
-                    await result[dev['deviceName']].update_status()
-        else:
+        if response.status_code != 200:
             get_logger(__name__).error(f"Error discover SW devices {response.status_code}: {response.text}")
+            response.raise_for_status()
+        data = response.json()
+        devices = data['body']['deviceList']
+        for dev in devices:
+            if dev['deviceType'] in allow_device_types:
+                result[dev['deviceName']] = SwitchBotDevice(dev)
+        # Fetch every device's status at once
+        await asyncio.gather(*[device.update_status() for device in result.values()], return_exceptions=True)
         return result
     
     def get_alias(self):
@@ -68,6 +134,15 @@ class SwitchBotDevice(Device):
     
     def get_status(self):
         return self.status
+
+    def to_record(self):
+        return {"device": self.actual_device, "status": self.status}
+
+    @staticmethod
+    def from_record(record):
+        device = SwitchBotDevice(record["device"])
+        device.status = record["status"]
+        return device
     
     def get_desc(self):
         if self.actual_device['deviceType'] == 'Smart Lock':
@@ -77,7 +152,7 @@ class SwitchBotDevice(Device):
         return "UNKNOWN"
     
     async def change_status(self, new_status):
-        url = f"https://api.switch-bot.com/v1.1/devices/{self.actual_device['deviceId']}/commands"
+        path = f"/v1.1/devices/{self.actual_device['deviceId']}/commands"
         payload = {}
         if self.actual_device['deviceType'] == 'Bot':
             if new_status == "on":
@@ -87,78 +162,151 @@ class SwitchBotDevice(Device):
         else:
             return
         
-        response = requests.post(url, headers=SwitchBotDevice.apiHeader, json=payload)
-        if response.status_code == 200:
-            pass
-        else:
+        response = await SwitchBotDevice.client.post(path, json=payload)
+        if response.status_code != 200:
             get_logger(__name__).error(f"Error Set SW device status {response.status_code}: {response.text}")
+            response.raise_for_status()
 
-        # wait for execution
+    async def update_status(self):
+        response = await SwitchBotDevice.client.get(f"/v1.1/devices/{self.actual_device['deviceId']}/status")
+        if response.status_code != 200:
+            get_logger(__name__).error(f"Error Get SW device status {response.status_code}: {response.text}")
+            response.raise_for_status()
+        data = response.json()
         if self.actual_device['deviceType'] == 'Smart Lock':
-            time.sleep(10)
+            self.status = data['body']['lockState']
         elif self.actual_device['deviceType'] == 'Bot':
-            time.sleep(40)
+            self.status = data['body']['power']
+        else:
+            self.status = "UNKNOWN"
 
-    async def update_status(self):
-        url = f"https://api.switch-bot.com/v1.1/devices/{self.actual_device['deviceId']}/status"
-        response = requests.get(url, headers=SwitchBotDevice.apiHeader)
-        if response.status_code == 200:
-            data = response.json()
-            if self.actual_device['deviceType'] == 'Smart Lock':
-                self.status = data['body']['lockState']
-            elif self.actual_device['deviceType'] == 'Bot':
-                self.status = data['body']['power']
-            else:
-                self.status = "UNKNOWN"
+    def apply_event(self, context):
+        """Take the state from a webhook event's context; False if it carries none for this device type"""
+        if self.actual_device['deviceType'] == 'Bot' and 'power' in context:
+            self.status = context['power'].lower()
+        elif self.actual_device['deviceType'] == 'Smart Lock' and 'lockState' in context:
+            self.status = context['lockState'].lower()
         else:
-            get_logger(__name__).error(f"Error Get SW device status {response.status_code}: {response.text}")
+            return False
+        SwitchBotDevice.webhook_active = True
+        if self.actual_device['deviceId'] in SwitchBotDevice.status_events:
+            SwitchBotDevice.status_events[self.actual_device['deviceId']].set()
+        return True
 
-    @staticmethod
-    def authenticate():
-        creds = SwitchBotDevice.credentials
-        # open token
-        token = creds['Key'] # copy and paste from the SwitchBot app V6.14 or later
-        # secret key
-        secret = creds['Secret'] # copy and paste from the SwitchBot app V6.14 or later
-        nonce = uuid.uuid4()
-        t = int(round(time.time() * 1000))
-        string_to_sign = '{}{}{}'.format(token, t, nonce)
-
-        string_to_sign = bytes(string_to_sign, 'utf-8')
-        secret = bytes(secret, 'utf-8')
-
-        sign = base64.b64encode(hmac.new(secret, msg=string_to_sign, digestmod=hashlib.sha256).digest())
-
-        #Build api header JSON
-        SwitchBotDevice.apiHeader['Authorization']=token
-        SwitchBotDevice.apiHeader['Content-Type']='application/json'
-        SwitchBotDevice.apiHeader['charset']='utf8'
-        SwitchBotDevice.apiHeader['t']=str(t)
-        SwitchBotDevice.apiHeader['sign']=str(sign, 'utf-8')
-        SwitchBotDevice.apiHeader['nonce']=str(nonce)
+    def pushes_state(self):
+        return SwitchBotDevice.webhook_active
+
+    async def wait_for_status(self, target, timeout):
+        event = SwitchBotDevice.status_events.setdefault(self.actual_device['deviceId'], asyncio.Event())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.status != target:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
 
 
 class KasaDevice(Device):
+    # Local plugs switch at once
+    confirm_first_delay = 0.2
+    confirm_max_delay = 2
+    confirm_deadline = 10
+    poll_idle = 60
+    poll_active = 5
+    state_ttl = 180
+
+    known = {}  # alias -> live KasaDevice, set by the controller before each discovery
+    discoveries = 0
+
+    @staticmethod
+    async def refresh_known(device):
+        """Update a known plug in place over its existing connection; None if it doesn't answer"""
+        try:
+            await device.connect()
+            await device.actual_device.update()
+            return device
+        except Exception as e:
+            get_logger(__name__).error(f"Error updating Kasa device {device.get_alias()} at {device.get_host()}: {e}")
+            return None
+
     @staticmethod
     async def discorverDevices():
         result = {}
+        KasaDevice.discoveries += 1
+        known = dict(KasaDevice.known)
+        # Known plugs are updated in place; a broadcast runs on the first discovery,
+        # every KASA_BROADCAST_EVERY after that, and whenever a known plug went missing
+        if known and (KasaDevice.discoveries - 1) % KASA_BROADCAST_EVERY != 0:
+            for device in await asyncio.gather(*[KasaDevice.refresh_known(device) for device in known.values()]):
+                if device is not None:
+                    result[device.get_alias()] = device
+            if all(alias in result for alias in known):
+                return result
+            get_logger(__name__).info("Some Kasa devices didn't answer at their known address, broadcasting")
         try:
             devices = await Discover.discover()
-            for dev in devices.values():
+            # Plugs still at their known address keep their object and connection
+            known_by_host = {device.get_host(): device for device in known.values() if device.actual_device is not None}
+
+            async def update(dev):
                 try:
+                    if dev.host in known_by_host:
+                        await dev.disconnect()
+                        return await KasaDevice.refresh_known(known_by_host[dev.host])
                     await dev.update()
-                    result[dev.alias] = KasaDevice(dev)
+                    return KasaDevice(dev)
                 except Exception as e:
-                    get_logger(__name__).error(f"Error updating Kasa device {dev.alias}: {e}")
+                    get_logger(__name__).error(f"Error updating Kasa device at {dev.host}: {e}")
+                    return None
+
+            for device in await asyncio.gather(*[update(dev) for dev in devices.values()]):
+                if device is not None:
+                    result[device.get_alias()] = device
         except Exception as e:
             get_logger(__name__).error(f"Error discovering Kasa devices: {e}")
         return result
+
+    def __init__(self, actual_device, record=None):
+        super().__init__(actual_device)
+        self.record = record  # saved state, used until the plug is reached
+
+    async def connect(self):
+        if self.actual_device is None:
+            dev = await Discover.discover_single(self.record["host"])
+            await dev.update()
+            self.actual_device = dev
+
+    async def close(self):
+        if self.actual_device is not None:
+            await self.actual_device.disconnect()
     
     def get_alias(self):
+        if self.actual_device is None:
+            return self.record["alias"]
         return self.actual_device.alias
     
     def get_status(self):
+        if self.actual_device is None:
+            return self.record["status"]
         return "on" if self.actual_device.is_on else "off"
+
+    def get_host(self):
+        if self.actual_device is None:
+            return self.record["host"]
+        return self.actual_device.host
+
+    def to_record(self):
+        return {"alias": self.get_alias(), "host": self.get_host(), "status": self.get_status()}
+
+    @staticmethod
+    def from_record(record):
+        return KasaDevice(None, record)
     
     def get_desc(self):
         return "Status could be on or off"
@@ -167,6 +315,7 @@ class KasaDevice(Device):
         retry_limit = 3
         while retry_limit > 0:
             try:
+                await self.connect()
                 if new_status == "on":
                     await self.actual_device.turn_on()
                 else:
@@ -175,38 +324,46 @@ class KasaDevice(Device):
             except Exception as e:
                 get_logger(__name__).error(f"Error controlling Kasa device {self.get_alias()}: {e}")
                 retry_limit -= 1
+                if retry_limit == 0:
+                    raise
 
     async def update_status(self):
         retry_limit = 3
         while retry_limit > 0:
             try:
+                await self.connect()
                 await self.actual_device.update()
                 break
             except Exception as e:
                 get_logger(__name__).error(f"Error updating Kasa device {self.get_alias()}: {e}")
                 retry_limit -= 1
+                if retry_limit == 0:
+                    raise
 
 class RoborockDevice(Device):
-    credentials = {}
+    session = None  # RoborockSession shared by all vacuums
+    confirm_first_delay = 2
+    confirm_max_delay = 5
+    confirm_deadline = 30
+    poll_idle = 300
+    poll_active = 15
+    state_ttl = 600
+
+    @staticmethod
+    def configure(creds):
+        RoborockDevice.session = RoborockSession(creds.get("username"), creds.get("password"))
     
     @staticmethod
     async def discorverDevices():
         results = {}
+        if not RoborockDevice.session.username:
+            return results
         try:
-            web_api = RoborockApiClient(username=RoborockDevice.credentials["username"])
-            user_data = await web_api.pass_login(password=RoborockDevice.credentials["password"])
-
-            home_data = await web_api.get_home_data_v2(user_data)
-            # Get product ids:
-            product_info: dict[str, HomeDataProduct] = {
-                    product.id: product for product in home_data.products
-                }
-            for device in home_data.devices:
-                device_data = DeviceData(device, product_info[device.product_id].model)
-                name = device_data.device.name
+            for name in await RoborockDevice.session.load_devices(reload=True):
                 results[name] = RoborockDevice(name)
         except Exception as e:
             get_logger(__name__).error(f"Error connecting to Roborock: {e}")
+            raise
         return results
     
     def __init__(self, name):
@@ -215,60 +372,52 @@ class RoborockDevice(Device):
         self.status = "unknown"
 
     async def do_thing(self, what_thing):
+        async def run(local_client):
+            if what_thing == "clean":
+                await local_client.send_command(RoborockCommand.APP_START)
+            elif what_thing == "stop":
+                await local_client.send_command(RoborockCommand.APP_PAUSE)
+            elif what_thing == "return":
+                await local_client.send_command(RoborockCommand.APP_CHARGE)
+            else:
+                pass
+
+            # The command only starts the change, confirm_status polls until it shows
+            status = await local_client.get_status()
+            return status.state
         try:
-            web_api = RoborockApiClient(username=RoborockDevice.credentials["username"])
-            user_data = await web_api.pass_login(password=RoborockDevice.credentials["password"])
-
-            home_data = await web_api.get_home_data_v2(user_data)
-            # Get product ids:
-            product_info: dict[str, HomeDataProduct] = {
-                    product.id: product for product in home_data.products
-                }
-            for device in home_data.devices:
-                device_data = DeviceData(device, product_info[device.product_id].model)
-                name = device_data.device.name
-                if name == self.name:
-                    mqtt_client = RoborockMqttClientV1(user_data, device_data)
-                    networking = await mqtt_client.get_networking()
-                    local_device_data = DeviceData(device, product_info[device.product_id].model, networking.ip)
-                    local_client = RoborockLocalClientV1(local_device_data)
-                    
-                    status = await local_client.get_status()
-                    
-                    if what_thing == "clean":
-                        await local_client.send_command(RoborockCommand.APP_START)
-                    elif what_thing == "stop":
-                        await local_client.send_command(RoborockCommand.APP_PAUSE)
-                    elif what_thing == "return":
-                        await local_client.send_command(RoborockCommand.APP_CHARGE)
-                    else:
-                        pass
-                    
-                    time.sleep(5)
-                    status = await local_client.get_status()
-                    status = status.state
-                    if status == 8 or status == 100 or status == 103 or status == 12 or status == 101 or status == 15 or status == 6:
-                        self.status = "docked"
-                    elif status == 5:
-                        self.status = "cleaning"
-                    elif status == 3 or status == 10:
-                        self.status = "stopped"
-                    else:
-                        self.status = "unknown"
-                    print(f"device status {status} and self {self.status}")
-                    break
-            return "Done"
+            status = await RoborockDevice.session.call(self.name, run)
+            if status == 8 or status == 100 or status == 103 or status == 12 or status == 101 or status == 15 or status == 6:
+                self.status = "docked"
+            elif status == 5:
+                self.status = "cleaning"
+            elif status == 3 or status == 10:
+                self.status = "stopped"
+            else:
+                self.status = "unknown"
+            get_logger(__name__).debug(f"Roborock {self.name} state {status} is {self.status}")
         except Exception as e:
             get_logger(__name__).error(f"Failed to connect Roborock {e}")
-            return "Done"
-        finally:
-            return "Done"
+            raise
+        return "Done"
     
     def get_alias(self):
         return self.name
     
     def get_status(self):
         return self.status
+
+    def is_active(self):
+        return self.status == "cleaning"
+
+    def to_record(self):
+        return {"name": self.name, "status": self.status}
+
+    @staticmethod
+    def from_record(record):
+        device = RoborockDevice(record["name"])
+        device.status = record["status"]
+        return device
     
     def get_desc(self):
         return "Status could be docked, cleaning, stopped or unknown. Changing the status to docked means returning it to dock."
@@ -289,81 +438,88 @@ class RoborockDevice(Device):
             except Exception as e:
                 get_logger(__name__).error(f"Error controlling Roborock device {self.get_alias()}: {e}")
                 retry_limit -= 1
+                if retry_limit == 0:
+                    raise
 
     async def update_status(self):
-       #await self.do_thing("get_status")
-       pass
+        await self.do_thing("get_status")
 
 class WhiskerDevice(Device):
-    credentials = {}
-    
+    session = None  # WhiskerSession shared by all Litter-Robots
+    confirm_first_delay = 1
+    confirm_max_delay = 5
+    confirm_deadline = 30
+    poll_idle = 300
+    poll_active = 30
+    state_ttl = 600
+
+    @staticmethod
+    def configure(creds):
+        WhiskerDevice.session = WhiskerSession(creds.get('username'), creds.get('password'))
+
     @staticmethod
     async def discorverDevices():
         result = {}
         try:
-            account = Account()
-            # Connect to the API and load robots.
-            await account.connect(username=WhiskerDevice.credentials['username'], password=WhiskerDevice.credentials['password'], load_robots=True)
-
-            # Print robots associated with account.
-            for robot in account.robots:
+            for robot in await WhiskerDevice.session.robots(reload=True):
                 result[robot.name] = WhiskerDevice(robot)
         except Exception as e:
             get_logger(__name__).error(f"Failed to connect Whisker {e}")
-        finally:
-            await account.disconnect()
+            raise
         return result
     
-    def __init__(self, actual_device):
+    def __init__(self, actual_device, name=None):
         super().__init__(actual_device)
-        self.name = actual_device.name
+        self.name = actual_device.name if actual_device is not None else name
         self.status_ = "unknown"
 
     async def do_thing(self, what_thing):
-        account = None
-        try:
-            account = Account()
-            # Connect to the API and load robots.
-            await account.connect(username=WhiskerDevice.credentials['username'], password=WhiskerDevice.credentials['password'], load_robots=True)
-
-            # Print robots associated with account.
-            for robot in account.robots:
-                if robot.name == self.name:
-                    if what_thing == "get_status":
-                        status = robot.status
-                        if status.value == "RDY":
-                            return "on"
-                        elif status.value == "OFF":
-                            return "off"
-                        elif status.value == "CCP":
-                            return "cleaning"
-                        else:
-                            return "unknown"
-                    elif what_thing == "turn_on":
-                        await robot.set_power_status(True)
-                    elif what_thing == "turn_off":
-                        await robot.set_power_status(False)
-                    elif what_thing == "clean":
-                        await robot.start_cleaning()
-                    else:
-                        pass
-                    break
+        async def run(account):
+            # Robots are cached by the session, a status read is one refresh of this robot
+            robot = await WhiskerDevice.session.robot(self.name)
+            if robot is None:
+                return "unknown" if what_thing == "get_status" else "Done"
+            if what_thing == "get_status":
+                await robot.refresh()
+                status = robot.status
+                if status.value == "RDY":
+                    return "on"
+                elif status.value == "OFF":
+                    return "off"
+                elif status.value == "CCP":
+                    return "cleaning"
+                else:
+                    return "unknown"
+            elif what_thing == "turn_on":
+                await robot.set_power_status(True)
+            elif what_thing == "turn_off":
+                await robot.set_power_status(False)
+            elif what_thing == "clean":
+                await robot.start_cleaning()
             return "Done"
+        try:
+            return await WhiskerDevice.session.call(run)
         except Exception as e:
             get_logger(__name__).error(f"Failed to connect Whisker {e}")
-            return "unknown" if what_thing == "get_status" else "Done"
-        finally:
-            if account:
-                try:
-                    await account.disconnect()
-                except:
-                    pass
+            raise
     
     def get_alias(self):
         return self.name
     
     def get_status(self):
         return self.status_
+
+    def is_active(self):
+        return self.status_ == "cleaning"
+
+    def to_record(self):
+        return {"name": self.name, "status": self.status_}
+
+    @staticmethod
+    def from_record(record):
+        device = WhiskerDevice(None, record["name"])
+        device.status_ = record["status"]
+        return device
     
     def get_desc(self):
         return "Status could be on, off, cleaning or unknown."
@@ -384,64 +540,558 @@ class WhiskerDevice(Device):
             except Exception as e:
                 get_logger(__name__).error(f"Error controlling Whisker device {self.get_alias()}: {e}")
                 retry_limit -= 1
+                if retry_limit == 0:
+                    raise
 
     async def update_status(self):
         self.status_ = await self.do_thing("get_status")
 
+# Backends to discover
+DISCOVERY_BACKENDS = [
+    ("Kasa", KasaDevice),
+    ("SwitchBot", SwitchBotDevice),
+    ("Whisker", WhiskerDevice),
+    ("Roborock", RoborockDevice),
+]
+DISCOVERY_TIMEOUTS = {"Kasa": 15, "SwitchBot": 20, "Whisker": 30, "Roborock": 30}
+RETIRE_AFTER_MISSES = 2
+ACTUATION_ATTEMPTS = 3  # commands sent before giving up on a device
+# Devices of one vendor changed at the same time; cloud APIs rate limit, local plugs don't mind
+VENDOR_CONCURRENCY = {"Kasa": 8, "SwitchBot": 2, "Whisker": 1, "Roborock": 1}
+KASA_BROADCAST_EVERY = 6  # Kasa discoveries per broadcast, the others go to known hosts only
+REGISTRY_PATH = "device_registry.json"
+FAST_POLL_WINDOW = 120  # seconds a changed device is polled at its poll_active rate
+MAX_POLL_SLEEP = 60
+# Errors raised on our side of a backend, not counted by its circuit breaker
+BREAKER_LOCAL_ERRORS = {"SwitchBot": (SwitchBotQuotaExceeded,)}
+
+async def confirm_status(device, target, poll=None):
+    """
+    Poll the device until it reports `target` or its confirm_deadline passes,
+    backing off exponentially with jitter between polls. Returns True as soon
+    as the change is seen. `poll` reads the status, device.update_status by
+    default; CircuitOpen from it ends the confirmation.
+    """
+    poll = poll or device.update_status
+    if device.pushes_state():
+        # The device reports the change itself; read it once at the end in case the event got lost
+        if await device.wait_for_status(target, device.confirm_deadline):
+            return True
+        try:
+            await poll()
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            get_logger(__name__).error(f"Error polling {device.get_alias()}: {e}")
+        return device.get_status() == target
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + device.confirm_deadline
+    delay = device.confirm_first_delay
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        # Jitter spreads out polls of devices changed together
+        await asyncio.sleep(min(random.uniform(delay / 2, delay), remaining))
+        try:
+            await poll()
+        except CircuitOpen:
+            raise
+        except Exception as e:
+            get_logger(__name__).error(f"Error polling {device.get_alias()}: {e}")
+        if device.get_status() == target:
+            return True
+        delay = min(delay * 2, device.confirm_max_delay)
+
+class ActuationJob:
+    """Handle for a device change running in the background"""
+    _ids = itertools.count(1)
+
+    def __init__(self, aliases, statuses, on_done=None):
+        self.id = next(ActuationJob._ids)
+        self.aliases = list(aliases)
+        self.statuses = list(statuses)
+        self.state = "pending"  # pending, running, done or failed
+        self.results = {}  # alias -> "pending", "running", "done" or "failed"
+        for alias in self.aliases:
+            self.results[alias] = "pending"
+        self.created = time.time()
+        self.finished = None
+        # Callbacks called with the job once every device has settled; requests
+        # folded into this job add theirs
+        self.on_done = [on_done] if on_done else []
+
+    def target(self, alias):
+        return self.statuses[self.aliases.index(alias)]
+
+    def retarget(self, alias, status):
+        """Replace the status a still pending device is changed to"""
+        self.statuses[self.aliases.index(alias)] = status
+
+    def succeeded(self):
+        return [alias for alias in self.aliases if self.results[alias] == "done"]
+
+    def failed(self):
+        return [alias for alias in self.aliases if self.results[alias] == "failed"]
+
+    def summary(self):
+        """Outcome to tell the user, listing which devices changed and which didn't"""
+        parts = []
+        if self.succeeded():
+            parts.append(f"已完成：{'、'.join(self.succeeded())}")
+        if self.failed():
+            parts.append(f"失败：{'、'.join(self.failed())}")
+        return "；".join(parts)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "targets": [{"alias": alias, "status": status, "result": self.results[alias]} for alias, status in zip(self.aliases, self.statuses)],
+            "created": self.created,
+            "finished": self.finished,
+        }
+
 class DeviceController:
+    MAX_JOBS_KEPT = 20
 
-    def __init__(self, switch_bot_creds, whisker_creds, roborock_creds):
+    def __init__(self, switch_bot_creds, whisker_creds, roborock_creds, registry_path=REGISTRY_PATH):
         self.logger = get_logger(__name__)
         self.m_devices = {}
-        SwitchBotDevice.credentials = switch_bot_creds
-        WhiskerDevice.credentials = whisker_creds
-        RoborockDevice.credentials = roborock_creds
+        self.registry_path = registry_path
+        # The API call count survives restarts in a file next to the registry
+        SwitchBotDevice.configure(switch_bot_creds, os.path.join(os.path.dirname(registry_path), BUDGET_PATH))
+        WhiskerDevice.configure(whisker_creds)
+        RoborockDevice.configure(roborock_creds)
+        self.on_change = None  # optional callback, called whenever device or job state changes
+        self.jobs = OrderedDict()  # job id -> ActuationJob, newest last
+        self.pending = {}  # alias -> the job waiting to change it, at most one per device
+        self.jobs_lock = threading.Lock()
+        self.device_locks = {}  # alias -> asyncio.Lock, one change per device at a time
+        self.vendor_limits = {}  # vendor -> asyncio.Semaphore, see VENDOR_CONCURRENCY
+        # One breaker per cloud backend, so an outage of one cloud fails fast instead of timing out
+        # every call. Kasa plugs are independent LAN devices, one dead plug says nothing about the others.
+        self.breakers = {
+            name: CircuitBreaker(name, local_errors=BREAKER_LOCAL_ERRORS.get(name, ()), on_change=self._notify_change)
+            for name, backend in DISCOVERY_BACKENDS if name != "Kasa"
+        }
+        self.backend_of = {}  # alias -> name of the backend that found it
+        self.missed = {}  # alias -> discoveries in a row that didn't find it
+        # State cache bookkeeping, only written on the device loop
+        self.read_at = {}  # alias -> time.time() of the last status read
+        self.next_poll = {}  # alias -> time.time() the poller reads it next
+        self.changed_at = {}  # alias -> time.time() of the last change
+        self.poll_wakeup = None  # asyncio.Event, set to make the poller look again
+        # All device I/O runs on this one long-lived loop, so device objects,
+        # their connections and sessions are reused between calls
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="device-loop", daemon=True)
+        self.loop_thread.start()
+        if switch_bot_creds.get("WebhookUrl"):
+            self.submit(self._setup_switchbot_webhook(switch_bot_creds["WebhookUrl"]))
+
+    def submit(self, coro):
+        """Schedule a coroutine on the device loop from any thread; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the device loop and wait for its result"""
+        return self.submit(coro).result(timeout)
+
+    async def _guarded(self, vendor, fn):
+        """Await fn() through the vendor's circuit breaker; raises CircuitOpen while it is open"""
+        breaker = self.breakers.get(vendor)
+        if breaker is None:
+            return await fn()
+        return await breaker.call(fn)
+
+    def getBackendHealth(self):
+        return [breaker.to_dict() for breaker in self.breakers.values()]
+
+    async def _discover(self, name, backend):
+        """Devices found by one backend, None if discovery failed"""
+        try:
+            return await self._guarded(name, lambda: asyncio.wait_for(backend.discorverDevices(), DISCOVERY_TIMEOUTS[name]))
+        except CircuitOpen as e:
+            self.logger.info(f"Skipping {name} discovery: {e}")
+        except asyncio.TimeoutError:
+            self.logger.error(f"Discovering {name} devices timed out after {DISCOVERY_TIMEOUTS[name]}s")
+        except Exception as e:
+            self.logger.error(f"Error updating {name} devices: {e}")
+        return None
+
+    async def _close(self, device):
+        try:
+            await device.close()
+        except Exception as e:
+            self.logger.error(f"Error closing {device.get_alias()}: {e}")
+
+    async def refreshDevices(self):
+        """
+        Rediscover every backend and merge the results into the live registry:
+        known devices are updated in place, new ones are added, and devices
+        missing from RETIRE_AFTER_MISSES successful discoveries in a row are
+        retired. A backend that fails or finds nothing keeps its devices.
+        The new map is swapped in at once, readers never wait or see it half done.
+        Returns True if the registry changed.
+        """
+        KasaDevice.known = {alias: device for alias, device in self.m_devices.items() if isinstance(device, KasaDevice)}
+        # All backends at once, each with its own timeout, so a slow cloud can't hold up the others
+        results = await asyncio.gather(*[self._discover(name, backend) for name, backend in DISCOVERY_BACKENDS])
+        devices = dict(self.m_devices)
+        changed = False
+        dropped = []  # objects no longer in the registry, closed once it is swapped
+        for (name, backend), found in zip(DISCOVERY_BACKENDS, results):
+            if not found:
+                continue
+            for alias, device in found.items():
+                self.missed.pop(alias, None)
+                if devices.get(alias) is device:
+                    # Backend updated the live object itself
+                    pass
+                elif alias in devices and type(devices[alias]) is type(device):
+                    # A new object for a known device, e.g. a plug at a new address
+                    await self._close(devices[alias])
+                    devices[alias].refresh_from(device)
+                else:
+                    if alias not in devices:
+                        self.logger.info(f"New {name} device: {alias}")
+                    else:
+                        dropped.append(devices[alias])
+                    devices[alias] = device
+                    changed = True
+            for alias in [alias for alias, device in devices.items() if self.backend_of.get(alias) == name and alias not in found]:
+                self.missed[alias] = self.missed.get(alias, 0) + 1
+                if self.missed[alias] >= RETIRE_AFTER_MISSES:
+                    self.logger.info(f"Retiring {name} device {alias}, not seen in {self.missed[alias]} discoveries")
+                    dropped.append(devices.pop(alias))
+                    del self.missed[alias]
+                    changed = True
+            now = time.time()
+            for alias, device in found.items():
+                self.backend_of[alias] = name
+                # Discovery reads the status of most devices, that counts as a poll
+                if devices[alias].get_status().lower() != "unknown":
+                    self.read_at[alias] = now
+                    self.next_poll[alias] = now + self._poll_interval(alias, devices[alias])
+        self.m_devices = devices
+        for device in dropped:
+            await self._close(device)
+        self._wake_poller()
+        self.saveRegistry()
+        return changed
 
     def updateDevices(self):
-        self.m_devices = {}
+        """Blocking refresh of the registry"""
+        self.run(self.refreshDevices())
+
+    def loadRegistry(self):
+        """Restore the devices saved by an earlier run; returns True if any were restored"""
         try:
-            self.m_devices.update(asyncio.run(KasaDevice.discorverDevices()))
+            with open(self.registry_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
         except Exception as e:
-            self.logger.error(f"Error updating Kasa devices: {e}")
+            self.logger.error(f"Error loading device registry {self.registry_path}: {e}")
+            return False
+        backends = dict(DISCOVERY_BACKENDS)
+        devices = {}
+        now = time.time()
+        for entry in data.get("devices", []):
+            backend = backends.get(entry.get("backend"))
+            if backend is None:
+                continue
+            try:
+                device = backend.from_record(entry["record"])
+            except Exception as e:
+                self.logger.error(f"Error restoring device {entry.get('alias')}: {e}")
+                continue
+            alias = entry["alias"]
+            devices[alias] = device
+            self.backend_of[alias] = entry["backend"]
+            self.read_at[alias] = entry.get("read_at", 0)
+            self.next_poll[alias] = now + self._poll_interval(alias, device)
+        self.m_devices = devices
+        self.logger.info(f"Restored {len(devices)} devices from {self.registry_path}")
+        return len(devices) > 0
+
+    def saveRegistry(self):
+        """Write the registry and last known states, replacing the file at once"""
+        entries = []
+        for alias, device in self.m_devices.items():
+            if alias not in self.backend_of:
+                continue
+            record = device.to_record()
+            if record is None:
+                continue
+            entries.append({
+                "alias": alias,
+                "backend": self.backend_of[alias],
+                "read_at": self.read_at.get(alias, 0),
+                "record": record
+            })
         try:
-            self.m_devices.update(asyncio.run(SwitchBotDevice.discorverDevices()))
+            tmp_path = self.registry_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"saved": time.time(), "devices": entries}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.registry_path)
         except Exception as e:
-            self.logger.error(f"Error updating SwitchBot devices: {e}")
+            self.logger.error(f"Error saving device registry {self.registry_path}: {e}")
+
+    def warmStart(self):
+        """
+        Serve the saved registry right away and check it against the backends
+        in the background. Without a saved registry, discover and wait as before.
+        """
+        if not self.loadRegistry():
+            self.updateDevices()
+            return
+        def checked(future):
+            if future.exception():
+                self.logger.error(f"Device check after warm start failed: {future.exception()}")
+            self._notify_change()
+        self.submit(self.refreshDevices()).add_done_callback(checked)
+
+    def startRefresher(self, interval):
+        """Refresh the registry every `interval` seconds on the device loop, off the agent threads"""
+        async def refresh_loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.refreshDevices()
+                except Exception as e:
+                    self.logger.error(f"Device refresh failed: {e}")
+                # Statuses may have changed even if the registry didn't
+                self._notify_change()
+        self.submit(refresh_loop())
+
+    async def _setup_switchbot_webhook(self, url):
         try:
-            self.m_devices.update(asyncio.run(WhiskerDevice.discorverDevices()))
+            response = await SwitchBotDevice.client.setup_webhook(url)
+            self.logger.info(f"SwitchBot webhook setup for {url}: {response.status_code} {response.text}")
         except Exception as e:
-            self.logger.error(f"Error updating Whisker devices: {e}")
-        #self.m_devices.update(asyncio.run(RoborockDevice.discorverDevices()))
+            self.logger.error(f"Error setting up SwitchBot webhook: {e}")
+
+    def handleSwitchBotEvent(self, event):
+        """Apply a SwitchBot webhook event to the state cache; returns right away"""
+        self.submit(self._apply_switchbot_event(event))
+
+    async def _apply_switchbot_event(self, event):
+        context = event.get("context", {})
+        for alias, device in self.m_devices.items():
+            if isinstance(device, SwitchBotDevice) and device.actual_device.get("deviceId") == context.get("deviceMac"):
+                before = device.get_status()
+                if not device.apply_event(context):
+                    return
+                now = time.time()
+                self.read_at[alias] = now
+                self.next_poll[alias] = now + self._poll_interval(alias, device)
+                if device.get_status() != before:
+                    self._notify_change()
+                    self.saveRegistry()
+                return
+        self.logger.info(f"SwitchBot event for unknown device {context.get('deviceMac')}")
+
+    def _poll_interval(self, alias, device):
+        if device.is_active() or time.time() - self.changed_at.get(alias, 0) < FAST_POLL_WINDOW:
+            return device.poll_active
+        return device.poll_idle
+
+    def _wake_poller(self):
+        if self.poll_wakeup is not None:
+            self.poll_wakeup.set()
+
+    def is_stale(self, alias):
+        device = self.m_devices.get(alias)
+        return device is None or time.time() - self.read_at.get(alias, 0) > device.state_ttl
+
+    async def _poll(self, alias, device):
+        async with self._vendor_limit(alias):
+            try:
+                await self._guarded(self._vendor(alias), device.update_status)
+                self.read_at[alias] = time.time()
+            except CircuitOpen:
+                # Backend is down, the breaker already logged it; the cached state goes stale
+                pass
+            except Exception as e:
+                self.logger.error(f"Error polling {alias}: {e}")
+        self.next_poll[alias] = time.time() + self._poll_interval(alias, device)
+
+    def startPoller(self):
+        """
+        Keep the cached device states fresh on the device loop. Each device is
+        read again when its interval is up, fast while it is busy or was just
+        changed and slow when idle. Devices being changed are skipped, their
+        actuation reads them anyway.
+        """
+        async def poll_loop():
+            self.poll_wakeup = asyncio.Event()
+            while True:
+                devices = self.m_devices
+                now = time.time()
+                due = [alias for alias in devices if self.next_poll.get(alias, 0) <= now and not self._device_lock(alias).locked()]
+                if due:
+                    before = {alias: devices[alias].get_status() for alias in due}
+                    await asyncio.gather(*[self._poll(alias, devices[alias]) for alias in due])
+                    if any(devices[alias].get_status() != before[alias] for alias in due):
+                        self._notify_change()
+                        self.saveRegistry()
+                wait = min([self.next_poll.get(alias, now) for alias in devices] + [now + MAX_POLL_SLEEP]) - time.time()
+                self.poll_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.poll_wakeup.wait(), max(wait, 0.5))
+                except asyncio.TimeoutError:
+                    pass
+        self.submit(poll_loop())
 
     def getDevicesInfo(self):
+        """Cached states, never touches the network"""
         result = []
-        for name in self.m_devices:
+        devices = self.m_devices
+        for name in devices:
             result.append({
-                "alias": self.m_devices[name].get_alias(),
-                "status": self.m_devices[name].get_status(),
-                "description": self.m_devices[name].get_desc()
+                "alias": devices[name].get_alias(),
+                "status": devices[name].get_status(),
+                "stale": self.is_stale(name),
+                "description": devices[name].get_desc()
             })
         return result
 
-    def changeDeviceStatus(self, aliases, statuses):
-        index = 0
-        for alias in aliases:
-            retry_time = 5
-            while retry_time > 0:
-                try:
-                    print(f"Try Change {alias} to {statuses[index]}")
-                    asyncio.run(self.m_devices[alias].update_status())
-                    asyncio.run(self.m_devices[alias].change_status(statuses[index]))
-                    asyncio.run(self.m_devices[alias].update_status())
-                    if self.m_devices[alias].get_status() == statuses[index]:
-                        break
-                    retry_time -= 1
-                    if retry_time == 0:
-                        self.logger.error(f"Failed to chagne {alias} to {statuses[index]}")
-                except Exception as e:
-                    self.logger.error(f"Error controlling device {alias}: {e}")
-                    break
-            index += 1
+    def _notify_change(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                self.logger.error(f"Device change callback failed: {e}")
+
+    def _vendor(self, alias):
+        if alias in self.backend_of:
+            return self.backend_of[alias]
+        return type(self.m_devices.get(alias)).__name__.replace("Device", "")
+
+    # Locks and semaphores below are only touched on the device loop
+    def _device_lock(self, alias):
+        return self.device_locks.setdefault(alias, asyncio.Lock())
+
+    def _vendor_limit(self, alias):
+        vendor = self._vendor(alias)
+        return self.vendor_limits.setdefault(vendor, asyncio.Semaphore(VENDOR_CONCURRENCY.get(vendor, 1)))
+
+    def submitChangeDeviceStatus(self, aliases, statuses, on_done=None):
+        """
+        Start changing devices in the background; returns an ActuationJob right away.
+        A device that already waits in an earlier job isn't queued again, that
+        job is retargeted to the new status instead. If that covers every
+        device, the earlier job is returned. With nothing to change no job is
+        made, None is returned and on_done is never called.
+        """
+        if not aliases:
+            return None
+        with self.jobs_lock:
+            new_aliases = []
+            new_statuses = []
+            folded_into = None
+            for alias, status in zip(aliases, statuses):
+                if alias in new_aliases:
+                    new_statuses[new_aliases.index(alias)] = status
+                elif alias in self.pending:
+                    self.pending[alias].retarget(alias, status)
+                    folded_into = folded_into or self.pending[alias]
+                else:
+                    new_aliases.append(alias)
+                    new_statuses.append(status)
+            if not new_aliases:
+                if on_done and folded_into is not None:
+                    folded_into.on_done.append(on_done)
+                job = None
+            else:
+                job = ActuationJob(new_aliases, new_statuses, on_done)
+                for alias in new_aliases:
+                    self.pending[alias] = job
+                self.jobs[job.id] = job
+                while len(self.jobs) > self.MAX_JOBS_KEPT:
+                    self.jobs.popitem(last=False)
+        self._notify_change()
+        if job is None:
+            return folded_into
+        # Runs on the device loop, no thread waits for it
+        self.submit(self._run_job(job)).add_done_callback(lambda future: self._finish_job(job, future))
+        return job
+
+    async def _run_job(self, job):
+        job.state = "running"
+        self._notify_change()
+        await asyncio.gather(*[self._change_one(alias, job) for alias in job.aliases])
+
+    def _finish_job(self, job, future):
+        if future.cancelled():
+            self.logger.error(f"Actuation job {job.id} was cancelled")
+        elif future.exception():
+            self.logger.error(f"Actuation job {job.id} failed: {future.exception()}")
+        with self.jobs_lock:
+            for alias in job.aliases:
+                if self.pending.get(alias) is job:
+                    del self.pending[alias]
+                if job.results[alias] != "done":
+                    job.results[alias] = "failed"
+        job.state = "done" if all(result == "done" for result in job.results.values()) else "failed"
+        job.finished = time.time()
+        self._notify_change()
+        for callback in job.on_done:
+            try:
+                callback(job)
+            except Exception as e:
+                self.logger.error(f"Actuation job {job.id} callback failed: {e}")
+
+    async def _change_one(self, alias, job):
+        # Waits for any earlier change of the same device, then for a free slot of its vendor
+        async with self._device_lock(alias), self._vendor_limit(alias):
+            with self.jobs_lock:
+                # From here on later requests queue a new job instead of retargeting this one
+                if self.pending.get(alias) is job:
+                    del self.pending[alias]
+                status = job.target(alias)
+                job.results[alias] = "running"
+            self._notify_change()
+            try:
+                ok = await self.actuate(alias, status)
+            except Exception as e:
+                self.logger.error(f"Error controlling device {alias}: {e}")
+                ok = False
+            # Confirmation just read the device; watch it closely for a while
+            now = time.time()
+            self.changed_at[alias] = now
+            if ok:
+                self.read_at[alias] = now
+            if alias in self.m_devices:
+                self.next_poll[alias] = now + self.m_devices[alias].poll_active
+            self._wake_poller()
+            self.saveRegistry()
+            job.results[alias] = "done" if ok else "failed"
+            self._notify_change()
+            return ok
+
+    def getJobsInfo(self):
+        with self.jobs_lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    async def actuate(self, alias, status):
+        """Send the change and poll until the device confirms it; True if it reached the status"""
+        device = self.m_devices[alias]
+        vendor = self._vendor(alias)
+        for attempt in range(1, ACTUATION_ATTEMPTS + 1):
+            self.logger.info(f"Changing {alias} to {status} (attempt {attempt})")
+            started = time.monotonic()
+            # Fails at once with CircuitOpen while the vendor's backend is down
+            await self._guarded(vendor, lambda: device.change_status(status))
+            if await confirm_status(device, status, lambda: self._guarded(vendor, device.update_status)):
+                self.logger.info(f"{alias} confirmed {status} after {time.monotonic() - started:.1f}s")
+                return True
+            self.logger.warning(f"{alias} did not reach {status} within {device.confirm_deadline}s")
+        self.logger.error(f"Failed to change {alias} to {status}")
+        return False
 
     def local_filter(self, text):
         text = text.replace(" ", "")
@@ -0,0 +1,110 @@
+import asyncio
+from roborock import HomeDataProduct, DeviceData
+from roborock.version_1_apis import RoborockMqttClientV1, RoborockLocalClientV1
+from roborock.web_api import RoborockApiClient
+from Core.utility import get_logger
+
+class RoborockSession:
+    """
+    Caches everything needed to reach a Roborock over the LAN: the cloud
+    login, the home data, each vacuum's local IP and its local client.
+    Nothing is fetched again until a call fails, so commands normally go
+    straight to the local client. Must be used from one event loop.
+    """
+
+    def __init__(self, username, password):
+        self.logger = get_logger(__name__)
+        self.username = username
+        self.password = password
+        self.web_api = None
+        self.user_data = None
+        self.devices = {}  # name -> DeviceData from the home data, without IP
+        self.local_ips = {}  # name -> LAN IP
+        self.local_clients = {}  # name -> RoborockLocalClientV1
+        self.lock = None  # created on first use, on the loop that uses it
+
+    async def _login(self):
+        if self.user_data is None:
+            self.web_api = RoborockApiClient(username=self.username)
+            self.user_data = await self.web_api.pass_login(password=self.password)
+            self.logger.info("Logged in to Roborock")
+        return self.user_data
+
+    async def load_devices(self, reload=False):
+        """name -> DeviceData for every vacuum in the home; `reload` fetches the home data again"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if reload or not self.devices:
+                user_data = await self._login()
+                home_data = await self.web_api.get_home_data_v2(user_data)
+                # Get product ids:
+                product_info: dict[str, HomeDataProduct] = {
+                        product.id: product for product in home_data.products
+                    }
+                devices = {}
+                for device in home_data.devices:
+                    device_data = DeviceData(device, product_info[device.product_id].model)
+                    devices[device_data.device.name] = device_data
+                self.devices = devices
+            return self.devices
+
+    async def local_client(self, name):
+        """Connected-on-demand local client for the vacuum called `name`"""
+        if name in self.local_clients:
+            return self.local_clients[name]
+        device_data = (await self.load_devices()).get(name)
+        if device_data is None:
+            raise KeyError(f"No Roborock called {name}")
+        if name not in self.local_ips:
+            # The IP is only known to the cloud, ask once over MQTT
+            mqtt_client = RoborockMqttClientV1(await self._login(), device_data)
+            try:
+                networking = await mqtt_client.get_networking()
+                self.local_ips[name] = networking.ip
+            finally:
+                try:
+                    await mqtt_client.async_disconnect()
+                except Exception:
+                    pass
+        local_device_data = DeviceData(device_data.device, device_data.model, self.local_ips[name])
+        self.local_clients[name] = RoborockLocalClientV1(local_device_data)
+        return self.local_clients[name]
+
+    async def drop_client(self, name):
+        """Forget the local client and IP of one vacuum, e.g. after it moved to another address"""
+        self.local_ips.pop(name, None)
+        client = self.local_clients.pop(name, None)
+        if client is not None:
+            try:
+                await client.async_disconnect()
+            except Exception:
+                pass
+
+    async def reset(self):
+        """Forget everything, the next call logs in again"""
+        for name in list(self.local_clients):
+            await self.drop_client(name)
+        self.local_ips.clear()
+        self.devices = {}
+        self.user_data = None
+
+    async def call(self, name, fn):
+        """
+        Run `fn(local_client)` for the vacuum `name`. On failure look up its
+        IP again and retry; if that fails too, log in again and retry once more.
+        """
+        try:
+            return await fn(await self.local_client(name))
+        except Exception as e:
+            self.logger.warning(f"Roborock {name} call failed, reconnecting: {e}")
+            await self.drop_client(name)
+        try:
+            return await fn(await self.local_client(name))
+        except Exception as e:
+            self.logger.warning(f"Roborock {name} call failed again, logging in again: {e}")
+            await self.reset()
+        return await fn(await self.local_client(name))
+
+    async def close(self):
+        await self.reset()
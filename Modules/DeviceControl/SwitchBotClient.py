@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date
+import httpx
+from Core.utility import get_logger
+
+# Optional import — HTTP/2 is used only when the h2 package is installed
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+API_BASE = "https://api.switch-bot.com"
+BUDGET_PATH = "switchbot_budget.json"
+
+class SwitchBotQuotaExceeded(Exception):
+    pass
+
+class RequestBudget:
+    """
+    Counts SwitchBot API calls per day. Polls stop once only `reserve`
+    calls are left, so there is always quota for commands; commands stop
+    only at the daily limit itself. With a `path` the count is kept in that
+    file, so a restart doesn't hand out the day's quota again.
+    """
+
+    def __init__(self, daily_limit=10000, reserve=1000, path=None):
+        self.logger = get_logger(__name__)
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.path = path
+        self.lock = threading.Lock()
+        self.day = date.today()
+        self.used = 0
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.logger.error(f"Error loading SwitchBot budget {self.path}: {e}")
+            return
+        # A count from an earlier day is stale, the quota has been reset since
+        if data.get("day") == self.day.isoformat():
+            self.used = int(data.get("used", 0))
+            self.logger.info(f"SwitchBot budget restored: {self.used}/{self.daily_limit} calls today")
+
+    def _save(self):
+        """Write the count, replacing the file at once; called with the lock held"""
+        if self.path is None:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"day": self.day.isoformat(), "used": self.used}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Error saving SwitchBot budget {self.path}: {e}")
+
+    def take(self, kind="poll"):
+        with self.lock:
+            today = date.today()
+            if today != self.day:
+                self.day = today
+                self.used = 0
+            limit = self.daily_limit - (self.reserve if kind == "poll" else 0)
+            if self.used >= limit:
+                raise SwitchBotQuotaExceeded(f"SwitchBot {kind} budget used up: {self.used}/{self.daily_limit} calls today")
+            self.used += 1
+            self._save()
+
+    def remaining(self):
+        with self.lock:
+            return self.daily_limit - self.used if self.day == date.today() else self.daily_limit
+
+class SwitchBotClient:
+    """
+    Async SwitchBot API client with one pooled keep-alive connection (HTTP/2
+    when available). Every request is signed with its own nonce and
+    timestamp, nothing shared is mutated. Must be used from one event loop.
+    """
+
+    def __init__(self, token, secret, daily_limit=10000, reserve=1000, budget_path=BUDGET_PATH):
+        self.logger = get_logger(__name__)
+        self.token = token
+        self.secret = secret.encode("utf-8")
+        self.budget = RequestBudget(daily_limit, reserve, budget_path)
+        self.client = None
+
+    def _headers(self):
+        nonce = str(uuid.uuid4())
+        t = str(int(round(time.time() * 1000)))
+        sign = base64.b64encode(hmac.new(self.secret, msg=f"{self.token}{t}{nonce}".encode("utf-8"), digestmod=hashlib.sha256).digest())
+        return {
+            "Authorization": self.token,
+            "Content-Type": "application/json",
+            "charset": "utf8",
+            "t": t,
+            "sign": sign.decode("utf-8"),
+            "nonce": nonce,
+        }
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=API_BASE,
+                http2=h2 is not None,
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=120),
+            )
+        return self.client
+
+    async def get(self, path, kind="poll"):
+        self.budget.take(kind)
+        return await self._get_client().get(path, headers=self._headers())
+
+    async def post(self, path, json, kind="command"):
+        self.budget.take(kind)
+        return await self._get_client().post(path, headers=self._headers(), json=json)
+
+    async def setup_webhook(self, url):
+        """Ask SwitchBot to send state change events of all devices to `url`"""
+        return await self.post("/v1.1/webhook/setupWebhook", json={"action": "setupWebhook", "url": url, "deviceList": "ALL"})
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,66 @@
+import asyncio
+from pylitterbot import Account
+from Core.utility import get_logger
+
+class WhiskerSession:
+    """
+    One logged-in Whisker account shared by every Litter-Robot for the life
+    of the process. pylitterbot refreshes the access token on its own; if a
+    call still fails the session logs in again once and retries. Robot
+    objects are cached by name and updated in place. Must be used from one
+    event loop.
+    """
+
+    def __init__(self, username, password):
+        self.logger = get_logger(__name__)
+        self.username = username
+        self.password = password
+        self.account = None
+        self.lock = None  # created on first use, on the loop that uses it
+
+    async def get_account(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if self.account is None:
+                account = Account()
+                await account.connect(username=self.username, password=self.password, load_robots=True)
+                self.logger.info(f"Logged in to Whisker, {len(account.robots)} robots")
+                self.account = account
+            return self.account
+
+    async def reset(self):
+        """Drop the session, the next call logs in again"""
+        account, self.account = self.account, None
+        if account is not None:
+            try:
+                await account.disconnect()
+            except Exception:
+                pass
+
+    async def call(self, fn):
+        """Run `fn(account)`, logging in again and retrying once if it fails"""
+        try:
+            return await fn(await self.get_account())
+        except Exception as e:
+            self.logger.warning(f"Whisker call failed, logging in again: {e}")
+            await self.reset()
+            return await fn(await self.get_account())
+
+    async def robots(self, reload=False):
+        """All robots of the account; `reload` asks the cloud for the current list"""
+        async def load(account):
+            if reload:
+                await account.refresh_robots()
+            return list(account.robots)
+        return await self.call(load)
+
+    async def robot(self, name):
+        """Cached robot object by name, None if the account has no such robot"""
+        for robot in await self.robots():
+            if robot.name == name:
+                return robot
+        return None
+
+    async def close(self):
+        await self.reset()
@@ -0,0 +1,46 @@
+# Stand-in for the SwitchBot cloud: posts the same webhook payloads the cloud
+# sends to the receiver on fastserver.py, so push updates can be tried locally.
+#   python webhook_example.py <deviceId> on --token <WebhookToken>
+#   python webhook_example.py <deviceId> unlocked --type lock --token <WebhookToken>
+import argparse
+import time
+import httpx
+
+def bot_event(device_id, power):
+    return {
+        "eventType": "changeReport",
+        "eventVersion": "1",
+        "context": {
+            "deviceType": "WoHand",
+            "deviceMac": device_id,
+            "power": power,
+            "battery": 100,
+            "deviceMode": "pressMode",
+            "timeOfSample": int(time.time() * 1000)
+        }
+    }
+
+def lock_event(device_id, lock_state):
+    return {
+        "eventType": "changeReport",
+        "eventVersion": "1",
+        "context": {
+            "deviceType": "WoLock",
+            "deviceMac": device_id,
+            "lockState": lock_state.upper(),
+            "battery": 100,
+            "timeOfSample": int(time.time() * 1000)
+        }
+    }
+
+parser = argparse.ArgumentParser()
+parser.add_argument("device_id", help="deviceId from the SwitchBot device list")
+parser.add_argument("state", help="on/off for a bot, locked/unlocked for a lock")
+parser.add_argument("--type", choices=["bot", "lock"], default="bot")
+parser.add_argument("--url", default="http://localhost:8080/api/switchbot/webhook")
+parser.add_argument("--token", required=True, help="SwitchBot.WebhookToken from config.json")
+args = parser.parse_args()
+
+event = bot_event(args.device_id, args.state) if args.type == "bot" else lock_event(args.device_id, args.state)
+response = httpx.post(args.url, json=event, params={"token": args.token})
+print(response.status_code, response.text)
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from Core.utility import get_logger
+
+# Optional import — without it only gzip variants are built
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# CRA puts a content hash in every file under static/, e.g. main.3f2a1c9b.js
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.(chunk\.)?[a-z0-9]+$")
+COMPRESSIBLE = {".js", ".css", ".html", ".json", ".svg", ".txt", ".map", ".ico"}
+MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+class FrontendAssets:
+    """
+    Serves the React build from memory and precompressed files.
+
+    At startup the build folder is listed once (with asset-manifest.json
+    for logging) and index.html is kept in memory along with its gzip and
+    brotli encodings. A background thread writes .gz/.br files next to
+    every compressible asset, so requests never compress anything. Hashed
+    files are cached forever by browsers; everything else revalidates.
+    """
+
+    def __init__(self, build_dir="frontend/build", check_interval=5.0):
+        self.logger = get_logger(__name__)
+        self.build_dir = build_dir
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.files = {}  # url path -> {"path", "media_type", "cache_control", "encodings": {encoding: path}}
+        self.index = None  # {"mtime", "etag", "bodies": {encoding or "identity": bytes}}
+        self.last_check = 0
+        self.load()
+
+    def available(self):
+        return self.index is not None
+
+    def load(self):
+        """List the build folder and read index.html; safe to call again after a rebuild"""
+        files = {}
+        if os.path.isdir(self.build_dir):
+            for root, _, names in os.walk(self.build_dir):
+                for name in names:
+                    if name.endswith((".gz", ".br")):
+                        continue
+                    path = os.path.join(root, name)
+                    url_path = os.path.relpath(path, self.build_dir).replace(os.sep, "/")
+                    files[url_path] = {
+                        "path": path,
+                        "media_type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                        "cache_control": IMMUTABLE if HASHED_NAME.search(name) else REVALIDATE,
+                        "encodings": self._existing_encodings(path),
+                    }
+        with self.lock:
+            self.files = files
+        self._load_index()
+        manifest = os.path.join(self.build_dir, "asset-manifest.json")
+        if os.path.exists(manifest):
+            try:
+                with open(manifest, encoding="utf-8") as f:
+                    entrypoints = json.load(f).get("entrypoints", [])
+                self.logger.info(f"Frontend build loaded: {len(files)} files, entrypoints {entrypoints}")
+            except Exception as e:
+                self.logger.error(f"Failed to read {manifest}: {e}")
+        threading.Thread(target=self._precompress, daemon=True).start()
+
+    @staticmethod
+    def _existing_encodings(path):
+        encodings = {}
+        mtime = os.stat(path).st_mtime
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = path + suffix
+            if os.path.exists(variant) and os.stat(variant).st_mtime >= mtime:
+                encodings[encoding] = variant
+        return encodings
+
+    def _load_index(self):
+        path = os.path.join(self.build_dir, "index.html")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, "rb") as f:
+                body = f.read()
+        except OSError:
+            self.index = None
+            return
+        bodies = {"identity": body, "gzip": gzip.compress(body, 9)}
+        if brotli:
+            bodies["br"] = brotli.compress(body)
+        self.index = {"mtime": mtime, "etag": '"' + hashlib.sha1(body).hexdigest()[:16] + '"', "bodies": bodies}
+
+    def _precompress(self):
+        with self.lock:
+            files = list(self.files.values())
+        count = 0
+        for entry in files:
+            path = entry["path"]
+            if os.path.splitext(path)[1] not in COMPRESSIBLE or os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                encodings = dict(entry["encodings"])
+                if "gzip" not in encodings:
+                    encodings["gzip"] = self._write_variant(path + ".gz", gzip.compress(data, 9))
+                    count += 1
+                if brotli and "br" not in encodings:
+                    encodings["br"] = self._write_variant(path + ".br", brotli.compress(data))
+                    count += 1
+                entry["encodings"] = encodings
+            except Exception as e:
+                self.logger.error(f"Failed to precompress {path}: {e}")
+        if count:
+            self.logger.info(f"Precompressed {count} frontend asset variants")
+
+    @staticmethod
+    def _write_variant(path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def _accepted(accept_encoding, available):
+        """Best encoding the client accepts out of the available ones, else None"""
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in available and encoding in accepted:
+                return encoding
+        return None
+
+    def _check_index(self):
+        # index.html changes when the frontend is rebuilt; look at most every few seconds
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        path = os.path.join(self.build_dir, "index.html")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != (self.index["mtime"] if self.index else None):
+            self.logger.info("Frontend build changed, reloading")
+            self.load()
+
+    def index_response(self, accept_encoding):
+        """(body, headers) for index.html, or None if the frontend isn't built"""
+        self._check_index()
+        index = self.index
+        if index is None:
+            return None
+        headers = {"Cache-Control": REVALIDATE, "ETag": index["etag"], "Vary": "Accept-Encoding"}
+        encoding = self._accepted(accept_encoding, index["bodies"])
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return index["bodies"][encoding or "identity"], headers
+
+    def asset(self, url_path, accept_encoding):
+        """(file path, media type, headers) for a build file, or None if there is no such file"""
+        entry = self.files.get(url_path)
+        if entry is None:
+            return None
+        headers = {"Cache-Control": entry["cache_control"], "Vary": "Accept-Encoding"}
+        encoding = self._accepted(accept_encoding, entry["encodings"])
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return entry["encodings"][encoding], entry["media_type"], headers
+        return entry["path"], entry["media_type"], headers
@@ -4,7 +4,7 @@ import json
 from Core.utility import get_logger
 
 class RobotTCPServer(threading.Thread):
-    def __init__(self, host='0.0.0.0', port=9000, callback=None):
+    def __init__(self, host='0.0.0.0', port=9000, callback=None, connection_callback=None):
         super().__init__(daemon=True)
         self.host = host
         self.port = port
@@ -12,6 +12,7 @@ class RobotTCPServer(threading.Thread):
         self.addr = None
         self.running = True
         self.status_callback = callback  # Optional: function to call with new status
+        self.connection_callback = connection_callback  # Optional: called with True/False on connect/disconnect
         self.logger = get_logger(__name__)
         self.is_connected = False
 
@@ -28,6 +29,8 @@ class RobotTCPServer(threading.Thread):
                     self.conn, self.addr = s.accept()
                     self.is_connected = True
                     self.logger.info(f"Connected by {self.addr}")
+                    if self.connection_callback:
+                        self.connection_callback(True)
 
                     while self.running:
                         data = self.conn.recv(4096)
@@ -49,7 +52,10 @@ class RobotTCPServer(threading.Thread):
                         except Exception:
                             pass
                     self.conn = None
+                    was_connected = self.is_connected
                     self.is_connected = False
+                    if was_connected and self.connection_callback:
+                        self.connection_callback(False)
                     self.logger.info("Ready to accept new connections.")
 
 
@@ -0,0 +1,141 @@
+import os
+import random
+import threading
+import time
+from Core.utility import get_logger
+
+# Optional import — only needed to report image dimensions
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+
+class ImageIndex:
+    """
+    In-memory list of the screensaver images in one folder.
+
+    The folder is scanned once; after that its mtime is checked at most every
+    check_interval seconds and, if it moved, the index is patched with just
+    the files that were added or removed. Picking a random image is O(1).
+    """
+
+    def __init__(self, folder, check_interval=5.0):
+        self.logger = get_logger(__name__)
+        self.folder = folder
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.images = []  # image names relative to folder
+        self.positions = {}  # image name -> index in self.images
+        self.folder_mtime = None
+        self.last_check = 0
+        self.generation = 0  # bumped whenever the set of images changes
+        self.sizes = {}  # image name -> (mtime_ns, width, height)
+
+    def set_folder(self, folder):
+        with self.lock:
+            if folder == self.folder:
+                return
+            self.folder = folder
+            self.images = []
+            self.positions = {}
+            self.folder_mtime = None
+            self.last_check = 0
+            self.generation += 1
+            self.sizes = {}
+
+    def refresh(self, force=False):
+        """Rescan the folder if it changed since the last scan. Blocking, keep it off the event loop."""
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+            try:
+                mtime = os.stat(self.folder).st_mtime_ns
+            except OSError:
+                if self.images:
+                    self.logger.warning(f"Screensaver folder {self.folder} is gone")
+                    self.generation += 1
+                self.images = []
+                self.positions = {}
+                self.folder_mtime = None
+                return
+            if mtime == self.folder_mtime:
+                return
+            try:
+                self._rescan()
+            except OSError as e:
+                # Keep serving the previous index and try again on the next check
+                self.logger.warning(f"Error scanning screensaver folder {self.folder}: {e}")
+                return
+            self.folder_mtime = mtime
+
+    def _rescan(self):
+        found = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                    found.add(entry.name)
+        removed = [name for name in self.images if name not in found]
+        for name in removed:
+            self._remove(name)
+        added = [name for name in found if name not in self.positions]
+        for name in added:
+            self.positions[name] = len(self.images)
+            self.images.append(name)
+        if added or removed:
+            self.generation += 1
+            self.logger.info(f"Screensaver index: +{len(added)} -{len(removed)}, {len(self.images)} images")
+
+    def _remove(self, name):
+        # Swap with the last entry so removal is O(1) too
+        self.sizes.pop(name, None)
+        index = self.positions.pop(name)
+        last = self.images.pop()
+        if last != name:
+            self.images[index] = last
+            self.positions[last] = index
+
+    def random_image(self):
+        """Name of a random image, or None if there are none"""
+        self.refresh()
+        with self.lock:
+            if not self.images:
+                return None
+            return random.choice(self.images)
+
+    def snapshot(self):
+        """(generation, list of image names)"""
+        self.refresh()
+        with self.lock:
+            return self.generation, list(self.images)
+
+    def dimensions(self, name):
+        """(width, height) as displayed, read from the image header once; None if unknown"""
+        if Image is None:
+            return None
+        path = os.path.join(self.folder, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            cached = self.sizes.get(name)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            with Image.open(path) as image:
+                width, height = image.size
+                # EXIF orientations 5-8 are rotated by 90 degrees
+                if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                    width, height = height, width
+        except Exception:
+            return None
+        self.sizes[name] = (mtime, width, height)
+        return width, height
+
+    def contains(self, name):
+        self.refresh()
+        with self.lock:
+            return name in self.positions
+
+    def __len__(self):
+        return len(self.images)
@@ -0,0 +1,70 @@
+import random
+import threading
+from collections import OrderedDict
+
+class Playlist:
+    """
+    Shuffled play order for one screen. Every image is shown once before
+    any image repeats; images added to the folder join the rest of the
+    current round and removed ones are skipped.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.generation = None
+        self.known = set()  # every image in the index at the last sync
+        self.upcoming = []  # rest of the current round, next image last
+        self.last_shown = None
+
+    def _sync(self):
+        generation, images = self.index.snapshot()
+        if generation == self.generation:
+            return
+        self.generation = generation
+        current = set(images)
+        self.upcoming = [name for name in self.upcoming if name in current]
+        for name in current - self.known:
+            self.upcoming.insert(random.randint(0, len(self.upcoming)), name)
+        self.known = current
+
+    def _new_round(self):
+        self.upcoming = list(self.known)
+        random.shuffle(self.upcoming)
+        # Don't show the same image twice in a row across rounds
+        if len(self.upcoming) > 1 and self.upcoming[-1] == self.last_shown:
+            self.upcoming[0], self.upcoming[-1] = self.upcoming[-1], self.upcoming[0]
+
+    def next(self, count):
+        """Names of the next `count` images (fewer only if the folder is empty)"""
+        self._sync()
+        result = []
+        while len(result) < count and self.known:
+            if not self.upcoming:
+                self._new_round()
+            self.last_shown = self.upcoming.pop()
+            result.append(self.last_shown)
+        return result
+
+    def remaining(self):
+        return len(self.upcoming)
+
+class PlaylistRegistry:
+    """One Playlist per client id, forgetting the least recently used clients"""
+
+    def __init__(self, index, max_clients=50):
+        self.index = index
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.playlists = OrderedDict()
+
+    def next(self, client_id, count):
+        """(image names, images left in this round)"""
+        with self.lock:
+            playlist = self.playlists.get(client_id)
+            if playlist is None:
+                playlist = Playlist(self.index)
+                self.playlists[client_id] = playlist
+                while len(self.playlists) > self.max_clients:
+                    self.playlists.popitem(last=False)
+            self.playlists.move_to_end(client_id)
+            return playlist.next(count), playlist.remaining()
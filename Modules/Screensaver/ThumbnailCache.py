@@ -0,0 +1,183 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from Core.utility import get_logger
+
+# Optional import — without Pillow the original images are served
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Requested widths are rounded up to one of these, so a handful of screen
+# sizes don't each fill the cache with their own copies.
+WIDTH_STEPS = [480, 640, 800, 1024, 1280, 1600, 1920, 2560]
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+class ThumbnailCache:
+    """
+    Display-sized copies of the screensaver images, kept in a bounded LRU
+    folder on disk.
+
+    A copy is keyed by source name, source mtime and size, width and format,
+    so an edited photo gets a new key (and ETag) by itself. Renders happen in
+    a single background worker; a request for a copy that is already being
+    rendered waits for that render instead of starting another.
+    """
+
+    def __init__(self, cache_dir="screensaver_cache", max_bytes=500 * 1024 * 1024):
+        self.logger = get_logger(__name__)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.total_bytes = 0
+        self.inflight = {}  # file name -> Future
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+        self.warmed = set()  # (width, format) combinations already warmed
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_entries()
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    @staticmethod
+    def snap_width(width):
+        for step in WIDTH_STEPS:
+            if width <= step:
+                return step
+        return WIDTH_STEPS[-1]
+
+    def _load_entries(self):
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)  # left over from an interrupted render
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _key(self, source_path, width, fmt):
+        stat = os.stat(source_path)
+        raw = f"{source_path}|{stat.st_mtime_ns}|{stat.st_size}|{width}|{fmt}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest() + "." + fmt
+
+    def cache_key(self, source_path, width, fmt="jpeg"):
+        """The ETag the copy for these parameters is served with"""
+        return self._key(source_path, self.snap_width(width), fmt).split(".")[0]
+
+    def get(self, source_path, width, fmt="jpeg"):
+        """
+        Blocking. Returns (path, etag, media_type) of the resized copy,
+        rendering it if needed.
+        """
+        width = self.snap_width(width)
+        name = self._key(source_path, width, fmt)
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                future = None
+            else:
+                future = self._submit(name, source_path, width, fmt)
+        if future is not None:
+            future.result()
+        return os.path.join(self.cache_dir, name), name.split(".")[0], FORMATS[fmt][1]
+
+    def warm(self, source_path, width, fmt="jpeg"):
+        """Render a copy in the background if it isn't cached yet"""
+        try:
+            name = self._key(source_path, self.snap_width(width), fmt)
+        except OSError:
+            return
+        with self.lock:
+            if name not in self.entries:
+                self._submit(name, source_path, self.snap_width(width), fmt)
+
+    def warm_all(self, source_paths, width, fmt="jpeg"):
+        """
+        Render copies of all given images in the background, once per
+        (width, format). One render is queued at a time, so on-demand
+        requests never wait behind more than one warm-up render. Stops
+        when the cache is nearly full, so warming never evicts itself.
+        """
+        width = self.snap_width(width)
+        with self.lock:
+            if (width, fmt) in self.warmed:
+                return
+            self.warmed.add((width, fmt))
+
+        def run():
+            for source_path in source_paths:
+                if self.total_bytes >= self.max_bytes * 0.9:
+                    self.logger.info(f"Thumbnail cache nearly full, stop warming {width}px {fmt}")
+                    return
+                try:
+                    name = self._key(source_path, width, fmt)
+                    with self.lock:
+                        future = None if name in self.entries else self._submit(name, source_path, width, fmt)
+                    if future is not None:
+                        future.result()
+                except Exception:
+                    pass
+            self.logger.info(f"Warmed {len(source_paths)} screensaver images at {width}px {fmt}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _submit(self, name, source_path, width, fmt):
+        # Called with self.lock held
+        future = self.inflight.get(name)
+        if future is None:
+            future = self.executor.submit(self._render, name, source_path, width, fmt)
+            self.inflight[name] = future
+        return future
+
+    def _render(self, name, source_path, width, fmt):
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = path + ".tmp"
+        try:
+            pil_format, _, options = FORMATS[fmt]
+            with Image.open(source_path) as image:
+                image.draft("RGB", (width, width))  # lets JPEG decode at reduced size
+                image = ImageOps.exif_transpose(image)
+                if image.width > width:
+                    image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                if image.mode not in ("RGB", "RGBA") or (fmt == "jpeg" and image.mode != "RGB"):
+                    image = image.convert("RGB")
+                image.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            with self.lock:
+                self.entries[name] = size
+                self.total_bytes += size
+                self._evict()
+        except Exception as e:
+            self.logger.error(f"Failed to resize {source_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(name, None)
+
+    def _evict(self):
+        # Called with self.lock held
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
@@ -1,5 +1,6 @@
 import json
 import os
+import threading
 from pathlib import Path
 from datetime import datetime
 from Core.utility import get_logger
@@ -17,6 +18,7 @@ class SetTimer:
 
     def __init__(self):
         self.timers = [] # list of Timer objects sorted by timestamp
+        self.lock = threading.Lock() # timers are added and executed from different threads
         self.timer_dir = Path("timers")
         self.timer_dir.mkdir(exist_ok=True)
         
@@ -43,8 +45,9 @@ class SetTimer:
     def add_timer(self, timestamp, actions, emailNotify):
         # Create a new timer object, put it into the queue and save it to a local file
         timer = Timer(timestamp, actions, emailNotify)
-        self.timers.append(timer)
-        self.timers.sort(key=lambda t: t.timestamp)
+        with self.lock:
+            self.timers.append(timer)
+            self.timers.sort(key=lambda t: t.timestamp)
         
         # Save to local file
         file_path = self.timer_dir / f"timer_{timestamp}.json"
@@ -55,14 +58,21 @@ class SetTimer:
         except Exception as e:
             logger.error(f"Error saving timer file {file_path}: {e}")
 
+    def next_due(self):
+        # Timestamp of the earliest timer, None if there are no timers
+        with self.lock:
+            return self.timers[0].timestamp if self.timers else None
+
     def execute_timers(self):
         # Go through the queue, return all timers that are due to be executed
         # Also, clean the local files of these returned timers and remove them from the queue
         current_time = datetime.now().timestamp()
         due_timers = []
-        remaining_timers = []
         
-        for timer in self.timers:
+        with self.lock:
+            timers = self.timers
+            self.timers = [t for t in timers if t.timestamp > current_time]
+        for timer in timers:
             if timer.timestamp <= current_time:
                 due_timers.append(timer)
                 # Clean the local file
@@ -75,11 +85,6 @@ class SetTimer:
                     logger.error(f"Error deleting timer file {file_path}: {e}")
                 if timer.emailNotify:
                     send_email("时间到了！", json.dumps(timer.actions, indent=2, ensure_ascii=False))
-            else:
-                remaining_timers.append(timer)
-        
-        # Update the queue with remaining timers
-        self.timers = remaining_timers
         
         return due_timers
     
@@ -1,15 +1,20 @@
 from Core.utility import setup_logging, get_logger
-import time
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from Core.StatusTracker import apply_delta
+from Modules.Screensaver.ImageIndex import ImageIndex
+from Modules.Screensaver.ThumbnailCache import ThumbnailCache, FORMATS
+from Modules.Screensaver.Playlist import PlaylistRegistry
+from Modules.Frontend.FrontendAssets import FrontendAssets
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from contextlib import asynccontextmanager
+from typing import Optional
 import socket
 import json
-import threading
+import asyncio
+import itertools
+import hashlib
+import hmac
 import os
-import glob
-import random
 
 setup_logging("85server.log")
 logger = get_logger("HomeServer")
@@ -17,144 +22,300 @@ logger = get_logger("HomeServer")
 AGENT_HOST = "127.0.0.1"
 AGENT_PORT = 9001
 
-# Persistent TCP connection
-_tcp_socket = None
-_tcp_lock = threading.Lock()
-_tcp_buffer = ""
-_response_ready = threading.Event()
-_pending_response = None
+REQUEST_TIMEOUT = 5.0
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 10.0
+STREAM_LIMIT = 16 * 1024 * 1024  # status replies carry the whole chat history
 
-def _connect_to_agent():
-    """Establish persistent connection to agent"""
-    global _tcp_socket, _tcp_buffer
-    try:
-        _tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        _tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        _tcp_socket.connect((AGENT_HOST, AGENT_PORT))
-        _tcp_buffer = ""
-        logger.info("Connected to agent control server")
-        # Start background thread to receive data
-        threading.Thread(target=_receive_loop, daemon=True).start()
-    except Exception as e:
-        logger.error(f"Failed to connect to agent: {e}")
-        _tcp_socket = None
-
-def _receive_loop():
-    """Background thread to receive data from agent"""
-    global _tcp_socket, _tcp_buffer, _pending_response, _response_ready
-    while True:
-        if _tcp_socket is None:
-            time.sleep(0.1)
-            continue
-        try:
-            data = _tcp_socket.recv(1024)
-            if not data:
-                logger.warning("Connection to agent closed, reconnecting...")
-                if _tcp_socket:
+class AgentClient:
+    """Asyncio client for the agent control server.
+
+    One persistent connection is shared by all requests. Every command
+    carries an "id" that the agent echoes back, so many commands can be in
+    flight and replies may arrive in any order. A background task reads
+    replies and reconnects whenever the connection drops.
+    """
+
+    def __init__(self, host=AGENT_HOST, port=AGENT_PORT, timeout=REQUEST_TIMEOUT, on_connect=None, on_event=None):
+        self.logger = get_logger("AgentClient")
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.pending = {}  # request id -> Future
+        self.request_ids = itertools.count(1)
+        self.connected = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+        self.reader_task = None
+        self.on_connect = on_connect  # coroutine function, run after every (re)connect
+        self.on_event = on_event  # called with pushed {"event": ...} messages
+
+    def start(self):
+        if self.reader_task is None:
+            self.reader_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+            self.reader_task = None
+        await self._close("Agent client stopped")
+
+    async def _run(self):
+        """Connect, read replies until the connection drops, then reconnect"""
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+                sock = self.writer.get_extra_info("socket")
+                if sock is not None:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                self.logger.info("Connected to agent control server")
+                self.connected.set()
+                delay = RECONNECT_DELAY
+                if self.on_connect:
+                    # Runs as its own task: its requests are answered by the read loop below
+                    asyncio.create_task(self.on_connect())
+                await self._read_loop()
+                self.logger.warning("Connection to agent closed, reconnecting...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Agent connection error: {e}")
+            await self._close("Connection to agent lost")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                self.logger.warning(f"Failed to parse response: {line[:200]}")
+                continue
+            if "event" in response and "id" not in response:
+                if self.on_event:
                     try:
-                        _tcp_socket.close()
-                    except:
-                        pass
-                _tcp_socket = None
-                time.sleep(1)
-                _connect_to_agent()
+                        self.on_event(response)
+                    except Exception as e:
+                        self.logger.error(f"Error handling agent event: {e}")
                 continue
-            _tcp_buffer += data.decode()
-            # Process complete messages
-            while "\n" in _tcp_buffer:
-                line, _tcp_buffer = _tcp_buffer.split("\n", 1)
-                try:
-                    response = json.loads(line)
-                    _pending_response = response
-                    _response_ready.set()
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to parse response: {line}")
-        except Exception as e:
-            logger.error(f"Error receiving from agent: {e}")
-            if _tcp_socket:
-                try:
-                    _tcp_socket.close()
-                except:
-                    pass
-            _tcp_socket = None
-            time.sleep(1)
-            _connect_to_agent()
-
-def send_command(command: dict):
-    """Send command using persistent connection"""
-    global _tcp_socket, _pending_response, _response_ready
-    
-    with _tcp_lock:
-        # Ensure connection exists
-        if _tcp_socket is None:
-            _connect_to_agent()
-            if _tcp_socket is None:
-                return {"error": "Failed to connect to agent"}
-        
-        # Clear previous response state
-        _pending_response = None
-        _response_ready.clear()
-        
+            request_id = response.pop("id", None)
+            future = self.pending.pop(request_id, None)
+            if future is None:
+                self.logger.warning(f"Dropping reply for unknown or expired request {request_id}")
+            elif not future.done():
+                future.set_result(response)
+
+    async def _close(self, reason):
+        """Drop the connection and fail every request still waiting on it"""
+        self.connected.clear()
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_result({"error": reason})
+
+    async def request(self, command: dict, timeout=None):
+        """Send a command and await its reply; errors come back as {"error": ...}"""
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
         try:
-            # Send command
-            _tcp_socket.sendall((json.dumps(command) + "\n").encode())
-            
-            # Wait for response (with timeout)
-            if _response_ready.wait(timeout=5.0):
-                response = _pending_response
-                _pending_response = None
-                return response if response else {"error": "Empty response"}
-            else:
-                return {"error": "Timeout waiting for response"}
+            await asyncio.wait_for(self.connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {"error": "Failed to connect to agent"}
+
+        request_id = next(self.request_ids)
+        future = loop.create_future()
+        self.pending[request_id] = future
+        try:
+            async with self.write_lock:
+                self.writer.write((json.dumps(dict(command, id=request_id)) + "\n").encode())
+                await self.writer.drain()
+            return await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            return {"error": "Timeout waiting for response"}
         except Exception as e:
-            logger.error(f"Error sending command: {e}")
-            _tcp_socket = None
+            self.logger.error(f"Error sending command: {e}")
             return {"error": str(e)}
+        finally:
+            self.pending.pop(request_id, None)
+
+STREAM_CLIENT_QUEUE = 100
+STREAM_KEEPALIVE = 15.0
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class StatusHub:
+    """
+    Mirrors the agent status from its pushed snapshot and deltas, and fans
+    every change out to the connected stream clients. Each message is encoded
+    once, no matter how many screens are listening.
+    """
+
+    def __init__(self):
+        self.logger = get_logger("StatusHub")
+        self.snapshot = None
+        self.clients = set()
+
+    def add_client(self):
+        queue = asyncio.Queue(maxsize=STREAM_CLIENT_QUEUE)
+        if self.snapshot is not None:
+            queue.put_nowait(_sse("snapshot", self.snapshot))
+        self.clients.add(queue)
+        return queue
+
+    def remove_client(self, queue):
+        self.clients.discard(queue)
+
+    def handle_event(self, message):
+        if message["event"] == "status_snapshot":
+            self.snapshot = message["snapshot"]
+            self._broadcast(_sse("snapshot", self.snapshot))
+        elif message["event"] == "status_delta" and self.snapshot is not None:
+            apply_delta(self.snapshot, message["delta"])
+            self._broadcast(_sse("delta", message["delta"]))
+
+    def _broadcast(self, data):
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # Client fell behind; throw its backlog away and resync it with a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_sse("snapshot", self.snapshot))
+
+status_hub = StatusHub()
+
+async def _subscribe_status():
+    response = await agent_client.request({"action": "server_subscribe"})
+    if "error" in response:
+        logger.error(f"Failed to subscribe to agent status: {response['error']}")
+
+agent_client = AgentClient(on_connect=_subscribe_status, on_event=status_hub.handle_event)
 
 # Lifespan context manager for startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    _connect_to_agent()
+    agent_client.start()
     yield
     # Shutdown
-    global _tcp_socket
-    if _tcp_socket:
-        _tcp_socket.close()
-        _tcp_socket = None
+    await agent_client.stop()
 
 app = FastAPI(lifespan=lifespan)
 
 @app.post("/task")
 async def post_task(task: dict):
     command = {"action": "server_task", "data": task}
-    response = send_command(command)
+    response = await agent_client.request(command)
     return response
 
+@app.post("/api/switchbot/webhook")
+async def switchbot_webhook(event: dict, token: Optional[str] = None):
+    """
+    Receiver for SwitchBot cloud webhooks (register with SwitchBot.WebhookUrl in
+    config.json). The URL must carry SwitchBot.WebhookToken as ?token=; without
+    a configured token the receiver is disabled.
+    """
+    expected = _load_config().get("SwitchBot", {}).get("WebhookToken")
+    if not expected:
+        return JSONResponse({"error": "webhook receiver disabled, set SwitchBot.WebhookToken"}, status_code=403)
+    if not token or not hmac.compare_digest(token.encode("utf-8"), str(expected).encode("utf-8")):
+        return JSONResponse({"error": "invalid token"}, status_code=403)
+    command = {"action": "server_task", "data": {"type": "switchbot_event", "event": event}}
+    response = await agent_client.request(command)
+    return response
+
+def _etag_version(if_none_match):
+    """Version number from an If-None-Match header holding one of our ETags"""
+    if not if_none_match:
+        return None
+    try:
+        return int(if_none_match.split(",")[0].strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        return None
+
 @app.get("/status")
-async def get_status():
+async def get_status(request: Request, since: Optional[int] = None):
+    """
+    Full status. With ?since=<version> only what changed after that version
+    is returned; with If-None-Match the full status is returned only if the
+    version moved on. Unchanged status answers 304 either way.
+    """
     command = {"action": "server_status"}
-    response = send_command(command)
-    return response
+    if since is not None:
+        command["since"] = since
+    else:
+        etag_version = _etag_version(request.headers.get("if-none-match"))
+        if etag_version is not None:
+            command["since"] = etag_version
+            command["full"] = True
+    response = await agent_client.request(command)
+    version = response.pop("version", None)
+    if version is None:
+        return response
+    headers = {"ETag": f'"{version}"', "Cache-Control": "no-cache"}
+    if response.get("not_modified"):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(response, headers=headers)
+
+@app.get("/status/stream")
+async def stream_status(request: Request):
+    """Server-sent events: one "snapshot" event with the full status, then a "delta" event per change"""
+    queue = status_hub.add_client()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            status_hub.remove_client(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # Screensaver endpoints
-def get_screensaver_config():
-    """Get screensaver folder path from config.json"""
+_config_cache = {"mtime": None, "config": {}}
+
+def _load_config():
+    """config.json contents, re-read only when the file changes"""
     try:
-        with open("config.json", encoding="utf-8") as f:
-            config = json.load(f)
-            return config.get("Screensaver", {}).get("ImageFolder", "screensaver_images")
+        mtime = os.stat("config.json").st_mtime_ns
+        if mtime != _config_cache["mtime"]:
+            with open("config.json", encoding="utf-8") as f:
+                _config_cache["config"] = json.load(f)
+            _config_cache["mtime"] = mtime
     except:
-        return "screensaver_images"
+        _config_cache["mtime"] = None
+        _config_cache["config"] = {}
+    return _config_cache["config"]
+
+def get_screensaver_config():
+    """Get screensaver folder path from config.json"""
+    return _load_config().get("Screensaver", {}).get("ImageFolder", "screensaver_images")
 
 def get_screensaver_timeout():
     """Get screensaver timeout in minutes from config.json"""
-    try:
-        with open("config.json", encoding="utf-8") as f:
-            config = json.load(f)
-            return config.get("Screensaver", {}).get("TimeoutMinutes", 5)
-    except:
-        return 5
+    return _load_config().get("Screensaver", {}).get("TimeoutMinutes", 5)
 
 @app.get("/api/screensaver/config")
 async def get_screensaver_config_api():
@@ -164,39 +325,104 @@ async def get_screensaver_config_api():
         "imageFolder": get_screensaver_config()
     })
 
-def _get_all_images():
-    """Get all available screensaver images from folder"""
-    folder = get_screensaver_config()
-    if not os.path.exists(folder):
-        return []
-    
-    # Supported image formats
-    extensions = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.bmp", "*.webp"]
-    images = []
-    for ext in extensions:
-        images.extend(glob.glob(os.path.join(folder, ext)))
-        images.extend(glob.glob(os.path.join(folder, ext.upper())))
-    
-    return images
+image_index = ImageIndex(get_screensaver_config())
+
+def _get_image_index():
+    """The screensaver image index, following the folder set in config.json"""
+    image_index.set_folder(get_screensaver_config())
+    return image_index
+
+_thumbnail_cache = None
+
+def _get_thumbnail_cache():
+    """Resized image cache, or None if Pillow isn't installed"""
+    global _thumbnail_cache
+    if _thumbnail_cache is None and ThumbnailCache.available():
+        screensaver = _load_config().get("Screensaver", {})
+        _thumbnail_cache = ThumbnailCache(
+            cache_dir=screensaver.get("CacheFolder", "screensaver_cache"),
+            max_bytes=screensaver.get("CacheMaxMB", 500) * 1024 * 1024,
+        )
+    return _thumbnail_cache
+
+def _pick_format(request, fmt):
+    """Requested format, else WebP when the browser accepts it"""
+    if fmt in FORMATS:
+        return fmt
+    return "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+
+def _image_url(image_name, width=None, fmt=None):
+    url = f"/api/screensaver/image/{image_name}"
+    params = []
+    if width:
+        params.append(f"w={width}")
+    if fmt:
+        params.append(f"format={fmt}")
+    return url + ("?" + "&".join(params) if params else "")
 
 @app.get("/api/screensaver/random-image")
-async def get_random_screensaver_image():
-    """Get a random screensaver image URL"""
-    images = _get_all_images()
-    if not images:
+async def get_random_screensaver_image(w: Optional[int] = None, fmt: Optional[str] = Query(None, alias="format")):
+    """Get a random screensaver image URL; with ?w= the URL points to a copy resized for that width"""
+    index = _get_image_index()
+    # May rescan the folder
+    image_name = await asyncio.to_thread(index.random_image)
+    if image_name is None:
         return JSONResponse({"error": "No images found", "imageUrl": None})
-    
-    # Pick a random image
-    random_image = random.choice(images)
-    folder = get_screensaver_config()
-    image_name = os.path.relpath(random_image, folder)
-    image_url = f"/api/screensaver/image/{image_name}"
-    
+
+    cache = _get_thumbnail_cache() if w else None
+    if cache:
+        fmt = fmt if fmt in FORMATS else "jpeg"
+        # Start rendering now so the copy is likely ready when the browser asks for it
+        cache.warm(os.path.join(index.folder, image_name), w, fmt)
+        if (cache.snap_width(w), fmt) not in cache.warmed:
+            cache.warm_all([os.path.join(index.folder, name) for name in list(index.images)], w, fmt)
+    image_url = _image_url(image_name, w, fmt)
     return JSONResponse({"imageUrl": image_url})
 
+playlists = PlaylistRegistry(image_index)
+
+@app.get("/api/screensaver/playlist")
+async def get_screensaver_playlist(request: Request, client: Optional[str] = None, count: int = 3, w: Optional[int] = None, fmt: Optional[str] = Query(None, alias="format")):
+    """
+    Next `count` images of this client's shuffled playlist. No image repeats
+    until all of them were shown. Each entry carries the image size and the
+    cache key (ETag) of its URL so the screen can preload the next images.
+    """
+    index = _get_image_index()
+    client_id = client or (request.client.host if request.client else "default")
+    # May rescan the folder
+    names, remaining = await asyncio.to_thread(playlists.next, client_id, max(1, min(count, 20)))
+
+    cache = _get_thumbnail_cache() if w else None
+    if cache:
+        fmt = fmt if fmt in FORMATS else "jpeg"
+    images = []
+    for name in names:
+        source_path = os.path.join(index.folder, name)
+        entry = {"name": name, "imageUrl": _image_url(name, w, fmt), "width": None, "height": None, "cacheKey": None}
+        size = await asyncio.to_thread(index.dimensions, name)
+        if size:
+            width, height = size
+            if cache and width > cache.snap_width(w) and not name.lower().endswith(".gif"):
+                height = round(height * cache.snap_width(w) / width)
+                width = cache.snap_width(w)
+            entry["width"], entry["height"] = width, height
+        try:
+            if cache and not name.lower().endswith(".gif"):
+                entry["cacheKey"] = cache.cache_key(source_path, w, fmt)
+                cache.warm(source_path, w, fmt)
+            else:
+                stat = os.stat(source_path)
+                # Same recipe as ThumbnailCache keys: images with equal mtime and size still differ by path
+                entry["cacheKey"] = hashlib.sha1(f"{source_path}|{stat.st_mtime_ns}|{stat.st_size}".encode("utf-8")).hexdigest()
+        except OSError:
+            continue
+        images.append(entry)
+    return JSONResponse({"images": images, "remaining": remaining, "total": len(index)})
+
 @app.get("/api/screensaver/image/{image_name:path}")
-async def get_screensaver_image(image_name: str):
-    """Serve a screensaver image"""
+async def get_screensaver_image(image_name: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = Query(None, alias="format")):
+    """Serve a screensaver image, resized to ?w= (and transcoded to ?format=) when given"""
     folder = get_screensaver_config()
     image_path = os.path.join(folder, image_name)
     
@@ -204,33 +430,84 @@ async def get_screensaver_image(image_name: str):
     if not os.path.abspath(image_path).startswith(os.path.abspath(folder)):
         return JSONResponse({"error": "Invalid path"}, status_code=400)
     
-    if os.path.exists(image_path) and os.path.isfile(image_path):
+    if not (os.path.exists(image_path) and os.path.isfile(image_path)):
+        return JSONResponse({"error": "Image not found"}, status_code=404)
+
+    cache = _get_thumbnail_cache() if w else None
+    # GIFs may be animated, keep them as they are
+    if cache is None or image_name.lower().endswith(".gif"):
+        return FileResponse(image_path)
+
+    fmt = _pick_format(request, fmt)
+    headers = {
+        "Cache-Control": "public, max-age=86400",
+        "Vary": "Accept",
+    }
+    # The ETag only needs a stat, answer revalidations without rendering anything
+    try:
+        headers["ETag"] = f'"{cache.cache_key(image_path, w, fmt)}"'
+    except OSError as e:
+        logger.error(f"Failed to stat {image_name}: {e}")
+        return FileResponse(image_path)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        path, etag, media_type = await asyncio.to_thread(cache.get, image_path, w, fmt)
+    except Exception as e:
+        logger.error(f"Failed to resize {image_name}: {e}")
         return FileResponse(image_path)
-    return JSONResponse({"error": "Image not found"}, status_code=404)
+    headers["ETag"] = f'"{etag}"'
+    return FileResponse(path, media_type=media_type, headers=headers)
 
 # Serve React frontend
-import os
+frontend_assets = FrontendAssets("frontend/build")
+
+def _index_response(request):
+    index = frontend_assets.index_response(request.headers.get("accept-encoding", ""))
+    if index is None:
+        return None
+    body, headers = index
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="text/html", headers=headers)
+
+def _asset_response(url_path, request):
+    asset = frontend_assets.asset(url_path, request.headers.get("accept-encoding", ""))
+    if asset is None:
+        return None
+    path, media_type, headers = asset
+    return FileResponse(path, media_type=media_type, headers=headers)
 
-# Mount static files if build directory exists
-if os.path.exists("frontend/build/static"):
-    app.mount("/static", StaticFiles(directory="frontend/build/static"), name="static")
+@app.get("/static/{asset_path:path}")
+async def serve_static(asset_path: str, request: Request):
+    """Serve hashed build assets, precompressed when the browser accepts it"""
+    response = _asset_response(f"static/{asset_path}", request)
+    if response is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return response
 
 @app.get("/")
-async def serve_index():
+async def serve_index(request: Request):
     """Serve React frontend index.html"""
-    if os.path.exists("frontend/build/index.html"):
-        return FileResponse("frontend/build/index.html")
+    response = _index_response(request)
+    if response is not None:
+        return response
     return {"error": "Frontend not built. Run 'npm run build' in frontend directory"}
 
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
+async def serve_frontend(full_path: str, request: Request):
     """Serve React frontend - catch all routes for client-side routing"""
     # Don't interfere with API routes
     if full_path.startswith("api/") or full_path == "task" or full_path == "status":
         return JSONResponse({"error": "Not found"}, status_code=404)
+    # Files at the build root (favicon, manifest.json, ...)
+    response = _asset_response(full_path, request)
+    if response is not None:
+        return response
     # Serve index.html for all other routes (React Router will handle routing)
-    if os.path.exists("frontend/build/index.html"):
-        return FileResponse("frontend/build/index.html")
+    response = _index_response(request)
+    if response is not None:
+        return response
     return JSONResponse({"error": "Frontend not built. Run 'npm run build' in frontend directory"}, status_code=404)
 
 if __name__ == "__main__":
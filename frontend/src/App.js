@@ -131,32 +131,26 @@ function App() {
     };
   }, [screensaverActive, screensaverTimeout]);
 
-  useEffect(() => {
-    // Fetch data periodically
-    const fetchData = async () => {
-      try {
-        const data = await api.fetchStatus();
-        setMessages(
-          (data.messages || []).map((m) => ChatMessage.fromJson(m.message))
-        );
-        setDevices((data.devices || []).map((d) => Device.fromJson(d)));
-        const robotStatusList = (data.robot?.status || []).map((r) =>
-          RobotStatus.fromJson(r)
-        );
-        if (data.robot) {
-          robotStatusList.push(
-            new RobotStatus('Connected', data.robot.connected ? 'Yes' : 'No')
-          );
-        }
-        setRobotStatuses(robotStatusList);
-      } catch (error) {
-        console.error('Failed to fetch status:', error);
-      }
-    };
+  const applyStatus = (data) => {
+    setMessages(
+      (data.messages || []).map((m) => ChatMessage.fromJson(m.message))
+    );
+    setDevices((data.devices || []).map((d) => Device.fromJson(d)));
+    const robotStatusList = (data.robot?.status || []).map((r) =>
+      RobotStatus.fromJson(r)
+    );
+    if (data.robot) {
+      robotStatusList.push(
+        new RobotStatus('Connected', data.robot.connected ? 'Yes' : 'No')
+      );
+    }
+    setRobotStatuses(robotStatusList);
+  };
 
-    fetchData();
-    const interval = setInterval(fetchData, 1000);
-    return () => clearInterval(interval);
+  useEffect(() => {
+    // Server pushes a snapshot, then every change as it happens
+    const unsubscribe = api.subscribeStatus(applyStatus);
+    return () => unsubscribe();
   }, [api]);
 
   const handleSendTask = async (task) => {
@@ -175,13 +169,8 @@ function App() {
         setScreensaverActive(true);
       }, timeoutMs);
       
+      // Resulting changes arrive through the status stream
       await api.sendTask(task);
-      // Refresh data after sending task
-      const data = await api.fetchStatus();
-      setMessages(
-        (data.messages || []).map((m) => ChatMessage.fromJson(m.message))
-      );
-      setDevices((data.devices || []).map((d) => Device.fromJson(d)));
     } catch (error) {
       console.error('Failed to send task:', error);
     }
@@ -1,18 +1,48 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './Screensaver.css';
 
+const PLAYLIST_BATCH = 3;
+
+// Stable per-screen id so the server keeps one shuffled playlist per screen
+const getClientId = () => {
+  let clientId = window.localStorage.getItem('screensaverClientId');
+  if (!clientId) {
+    clientId = Math.random().toString(36).slice(2);
+    window.localStorage.setItem('screensaverClientId', clientId);
+  }
+  return clientId;
+};
+
 function Screensaver({ serverAddress, onInteraction }) {
   const [currentImageUrl, setCurrentImageUrl] = useState(null);
   const [hasImages, setHasImages] = useState(true);
+  const upcoming = useRef([]);
 
-  const loadRandomImage = async () => {
+  const fetchPlaylist = async () => {
+    // Ask for copies sized for this screen instead of the original photos
+    const width = Math.round(window.innerWidth * (window.devicePixelRatio || 1));
+    const response = await fetch(
+      `http://${serverAddress}/api/screensaver/playlist?client=${getClientId()}&count=${PLAYLIST_BATCH}&w=${width}&format=webp`
+    );
+    const data = await response.json();
+    const images = (data.images || []).map((image) => {
+      const url = `http://${serverAddress}${image.imageUrl}`;
+      // Preload while the current image is showing
+      const preload = new Image();
+      preload.src = url;
+      return { ...image, url, preload };
+    });
+    upcoming.current = upcoming.current.concat(images);
+  };
+
+  const showNextImage = async () => {
     try {
-      const response = await fetch(`http://${serverAddress}/api/screensaver/random-image`);
-      const data = await response.json();
-      if (data.imageUrl) {
-        // Construct full URL with cache busting to ensure new image loads
-        const fullUrl = `http://${serverAddress}${data.imageUrl}?t=${Date.now()}`;
-        setCurrentImageUrl(fullUrl);
+      if (upcoming.current.length < 2) {
+        await fetchPlaylist();
+      }
+      const next = upcoming.current.shift();
+      if (next) {
+        setCurrentImageUrl(next.url);
         setHasImages(true);
       } else {
         setHasImages(false);
@@ -24,12 +54,13 @@ function Screensaver({ serverAddress, onInteraction }) {
   };
 
   useEffect(() => {
+    upcoming.current = [];
     // Load initial image
-    loadRandomImage();
+    showNextImage();
 
     // Change image every 30 seconds
     const interval = setInterval(() => {
-      loadRandomImage();
+      showNextImage();
     }, 30000);
 
     return () => clearInterval(interval);
@@ -68,7 +99,7 @@ function Screensaver({ serverAddress, onInteraction }) {
         onError={(e) => {
           // If image fails to load, try to load another one
           console.error('Failed to load screensaver image, trying another...');
-          loadRandomImage();
+          showNextImage();
         }}
       />
     </div>
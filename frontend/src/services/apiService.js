@@ -1,5 +1,46 @@
 import axios from 'axios';
 
+const replaceByKey = (items, updates, key) => {
+  updates.forEach((item) => {
+    const index = items.findIndex((existing) => existing[key] === item[key]);
+    if (index >= 0) {
+      items[index] = item;
+    } else {
+      items.push(item);
+    }
+  });
+};
+
+// Mirror of KEYED_SECTIONS and apply_delta in Core/StatusTracker.py
+const KEYED_SECTIONS = { devices: 'alias', device_jobs: 'id', backends: 'name' };
+
+export const applyStatusDelta = (status, delta) => {
+  let messages = status.messages;
+  if (delta.first_seq !== undefined) {
+    messages = messages.filter((m) => m.seq >= delta.first_seq);
+  }
+  messages = messages.concat(delta.messages || []);
+
+  const keyed = {};
+  Object.entries(KEYED_SECTIONS).forEach(([section, key]) => {
+    const removed = delta[`removed_${section}`] || [];
+    keyed[section] = (status[section] || []).filter((item) => !removed.includes(item[key]));
+    replaceByKey(keyed[section], delta[section] || [], key);
+  });
+
+  const robot = { ...status.robot };
+  if (delta.robot) {
+    if (delta.robot.connected !== undefined) {
+      robot.connected = delta.robot.connected;
+    }
+    const removedKeys = delta.robot.removed_status || [];
+    robot.status = (robot.status || []).filter((s) => !removedKeys.includes(s.key));
+    replaceByKey(robot.status, delta.robot.status || [], 'key');
+  }
+
+  return { ...status, ...keyed, messages, robot, version: delta.version ?? status.version };
+};
+
 class ApiService {
   constructor(baseUrl = '') {
     this.baseUrl = baseUrl;
@@ -21,6 +62,28 @@ class ApiService {
     }
   }
 
+  // Calls onStatus with the full status on connect and after every pushed change.
+  // Returns a function that closes the stream.
+  subscribeStatus(onStatus) {
+    let status = null;
+    const source = new EventSource(`${this.baseUrl}/status/stream`);
+    source.addEventListener('snapshot', (event) => {
+      status = JSON.parse(event.data);
+      onStatus(status);
+    });
+    source.addEventListener('delta', (event) => {
+      if (status) {
+        status = applyStatusDelta(status, JSON.parse(event.data));
+        onStatus(status);
+      }
+    });
+    source.onerror = (error) => {
+      // EventSource reconnects by itself and gets a fresh snapshot
+      console.error('Status stream error:', error);
+    };
+    return () => source.close();
+  }
+
   async sendTask(task) {
     try {
       const response = await this.client.post('/task', task);
@@ -1,6 +1,8 @@
 from Core.AgentControl import AgentControl
 from Core.utility import setup_logging, get_logger
-import time
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import collections
 import threading
 import socket
 import json
@@ -10,88 +12,192 @@ logger = get_logger("Home")
 
 agent_control = AgentControl()
 
+# Agent calls from all clients run on this pool, so a slow request on a
+# connection doesn't hold back the ones sent after it.
+request_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-request")
+
 def agent_loop():
     # try:
     logger.info("Agent is running...")
     agent_control.start()
     while True:
         try:
-            agent_control.process_task()
-            time.sleep(0.1)
+            # Sleep until a task arrives or the next timer / device refresh is due
+            agent_control.process_task(timeout=agent_control.next_wait_timeout())
         except Exception as e:
             logger.error("Agent loop error: %s", e)
     #     agent_control.stop()
 
 
+MAX_LINE_BYTES = 1024 * 1024
+OUTBOX_LIMIT = 64  # queued replies per client before writers wait
+EVENT_LIMIT = 256  # queued status events per client before it is resynced with a snapshot
+MAX_INFLIGHT = 32  # requests per client being answered at once before we stop reading
+
+class ControlClient:
+    """
+    One connection to the control server. All socket I/O happens on the
+    server's event loop: a reader task frames request lines, a writer task
+    drains a bounded reply outbox and a separate queue of status events.
+    Pushed status events come from the agent thread and are handed over with
+    call_soon_threadsafe. Only events are ever dropped, never replies.
+    """
+
+    def __init__(self, reader, writer, loop):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.addr = writer.get_extra_info("peername")
+        self.outbox = asyncio.Queue(maxsize=OUTBOX_LIMIT)
+        self.events = collections.deque()
+        self.has_output = asyncio.Event()
+        self.inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        self.request_tasks = set()  # keeps running handle_request tasks referenced
+        self.status_listener = None
+
+    @staticmethod
+    def encode(message):
+        try:
+            return (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error serializing response: {e}")
+            error_message = {"error": "Failed to serialize response"}
+            if "id" in message:
+                error_message["id"] = message["id"]
+            return (json.dumps(error_message) + "\n").encode('utf-8')
+
+    async def send(self, message):
+        # Waits while the outbox is full, so a slow reader slows down its own requests only
+        await self.outbox.put(self.encode(message))
+        self.has_output.set()
+
+    def subscribe_status(self):
+        """Push status snapshot and deltas to this client as {"event": ...} lines"""
+        if self.status_listener:
+            return
+        def listener(kind, payload):
+            # Runs on the agent thread; encode there and let the loop do the I/O
+            data = self.encode({"event": f"status_{kind}", kind: payload})
+            self.loop.call_soon_threadsafe(self.push_event, data)
+        self.status_listener = listener
+        agent_control.subscribe_status(listener)
+
+    def push_event(self, data):
+        if len(self.events) >= EVENT_LIMIT:
+            # Too far behind to catch up with deltas; start over from a snapshot
+            logger.warning(f"Client {self.addr} fell behind, resending status snapshot")
+            self.events.clear()
+            self.unsubscribe_status()
+            self.subscribe_status()
+            return
+        self.events.append(data)
+        self.has_output.set()
+
+    def unsubscribe_status(self):
+        if self.status_listener:
+            agent_control.unsubscribe_status(self.status_listener)
+            self.status_listener = None
+
+    async def write_loop(self):
+        try:
+            while True:
+                await self.has_output.wait()
+                self.has_output.clear()
+                while not self.outbox.empty() or self.events:
+                    # Replies first, someone is waiting on them
+                    data = self.outbox.get_nowait() if not self.outbox.empty() else self.events.popleft()
+                    self.writer.write(data)
+                    await self.writer.drain()
+        except Exception as e:
+            logger.error(f"Error writing to client {self.addr}: {e}")
+            # Ends the read loop in serve(), which cleans up
+            self.writer.close()
 
-def handle_client(conn, addr):
-    """Handle persistent client connection - keep connection alive for multiple requests"""
-    logger.info(f"Client connected from {addr}")
-    try:
-        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        buffer = ""
-        while True:
+    async def handle_request(self, line):
+        """Answer one line; the request id (if any) is echoed so the client can match replies sent out of order"""
+        try:
+            request_id = None
             try:
-                conn.settimeout(60.0)  # Set timeout to detect dead connections
-                data = conn.recv(1024)
-                if not data:
-                    logger.info(f"Client {addr} disconnected")
-                    break
-                buffer += data.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    response = {}
-                    try:
-                        request = json.loads(line)
-                        
-                        if request["action"] == "server_task":
-                            agent_control.push_task(request["data"])
-                            response = {"result": "Task received"}
-                        elif request["action"] == "server_status":
-                            try:
-                                status = agent_control.get_status()
-                                response = {"statuses": status}
-                            except Exception as e:
-                                logger.error(f"Error getting status: {e}")
-                                response = {"error": f"Failed to get status: {str(e)}"}
-                        else:
-                            response = {"error": "Unknown action"}
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON decode error: {e}")
-                        response = {"error": f"Invalid JSON: {str(e)}"}
-                    except Exception as e:
-                        logger.error(f"Error handling request: {e}", exc_info=True)
-                        response = {"error": str(e)}
-                    try:
-                        response_str = json.dumps(response, ensure_ascii=False) + "\n"
-                        conn.sendall(response_str.encode('utf-8'))
-                    except (TypeError, ValueError) as e:
-                        logger.error(f"Error serializing response: {e}")
-                        error_response = {"error": "Failed to serialize response"}
-                        conn.sendall((json.dumps(error_response) + "\n").encode('utf-8'))
-            except socket.timeout:
-                # Connection still alive, just no data - continue
-                continue
+                request = json.loads(line)
+                request_id = request.get("id")
+                if request.get("action") == "server_subscribe":
+                    self.subscribe_status()
+                    response = {"result": "Subscribed"}
+                else:
+                    # Agent calls may block, keep them off the event loop
+                    response = await self.loop.run_in_executor(request_executor, process_request, request)
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON decode error: {e}")
+                response = {"error": f"Invalid JSON: {str(e)}"}
             except Exception as e:
-                logger.error(f"Error handling client {addr}: {e}")
-                break
-    except Exception as e:
-        logger.error(f"Connection error with {addr}: {e}")
-    finally:
+                logger.error(f"Error handling request: {e}", exc_info=True)
+                response = {"error": str(e)}
+            if request_id is not None:
+                response["id"] = request_id
+            await self.send(response)
+        finally:
+            self.inflight.release()
+
+    async def serve(self):
+        logger.info(f"Client connected from {self.addr}")
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        writer_task = asyncio.create_task(self.write_loop())
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except ValueError:
+                    logger.error(f"Client {self.addr} sent a line over {MAX_LINE_BYTES} bytes, closing")
+                    break
+                if not line:
+                    logger.info(f"Client {self.addr} disconnected")
+                    break
+                if not line.strip():
+                    continue
+                await self.inflight.acquire()
+                task = asyncio.create_task(self.handle_request(line))
+                self.request_tasks.add(task)
+                task.add_done_callback(self.request_tasks.discard)
+        except Exception as e:
+            logger.error(f"Error handling client {self.addr}: {e}")
+        finally:
+            self.unsubscribe_status()
+            writer_task.cancel()
+            self.writer.close()
+            logger.info(f"Connection to {self.addr} closed")
+
+def process_request(request):
+    """Run one request from a control client and build its response"""
+    if request["action"] == "server_task":
+        agent_control.push_task(request["data"])
+        return {"result": "Task received"}
+    elif request["action"] == "server_status":
         try:
-            conn.close()
-        except:
-            pass
-        logger.info(f"Connection to {addr} closed")
+            version, status = agent_control.get_status_since(request.get("since"), request.get("full", False))
+            if status is None:
+                return {"not_modified": True, "version": version}
+            return {"statuses": status, "version": version}
+        except Exception as e:
+            logger.error(f"Error getting status: {e}")
+            return {"error": f"Failed to get status: {str(e)}"}
+    return {"error": "Unknown action"}
+
+async def serve_agent_control(host, port):
+    loop = asyncio.get_running_loop()
+
+    async def on_connect(reader, writer):
+        await ControlClient(reader, writer, loop).serve()
+
+    server = await asyncio.start_server(on_connect, host, port, limit=MAX_LINE_BYTES)
+    print(f"AgentControl server listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
 
 def run_agent_control_server(host="127.0.0.1", port=9001):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((host, port))
-        s.listen()
-        print(f"AgentControl server listening on {host}:{port}")
-        while True:
-            conn, addr = s.accept()
-            threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+    # All control connections share one event loop on this thread
+    asyncio.run(serve_agent_control(host, port))
 
 
 threading.Thread(target=run_agent_control_server, daemon=True).start()